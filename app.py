@@ -9,15 +9,47 @@ Actualizado: 2025-12-06 - Rankings corregidos para métricas invertidas
 """
 
 import os
+import sys
+import argparse
+import json
+import time
+import bisect
+import functools
+import hashlib
+import shutil
+import itertools
+import threading
+import subprocess
+import unicodedata
+import concurrent.futures
+from collections import OrderedDict
+from html import escape as escapar_html
+from dataclasses import dataclass, field
+import numpy as np
+import pyarrow as pa
 import dash
-from dash import dcc, html, callback, Input, Output
+import flask
+from dash import dcc, html, callback, clientside_callback, ClientsideFunction, Input, Output, State, Patch
 import pandas as pd
+import plotly
 import plotly.express as px
 import plotly.graph_objects as go
-from sqlalchemy import create_engine
+import plotly.io as pio
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    import fcntl
+except ImportError:  # Windows: sin coordinación entre procesos (un único proceso en local)
+    fcntl = None
+
+try:
+    import resource
+except ImportError:  # Windows: sin medida del pico de memoria
+    resource = None
+
 # ============================================================================
 # CONFIGURACIÓN DE BASE DE DATOS
 # ============================================================================
@@ -26,12 +58,102 @@ DB_USER = os.environ.get("DB_USER", "alen_depor")
 DB_PASSWORD = os.environ.get("DB_PASSWORD", "ik3QJOq6n")
 DB_HOST = os.environ.get("DB_HOST", "82.165.192.201")
 DB_NAME = os.environ.get("DB_NAME", "opta")
-DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+DATABASE_URL = os.environ.get(
+    "DATABASE_URL",
+    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+)
+
+# Pool de conexiones compartido por todas las cargas
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 3))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 2))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))  # Segundos
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))  # Segundos
+
+# Timeouts del driver MySQL (una conexión colgada no bloquea un hilo indefinidamente)
+DB_TIMEOUT_CONEXION = int(os.environ.get("DB_TIMEOUT_CONEXION", 10))  # Segundos
+DB_TIMEOUT_LECTURA = int(os.environ.get("DB_TIMEOUT_LECTURA", 300))  # Segundos
+
+# Tiempo máximo que una petición (o el arranque) espera a la base de datos; pasado ese tiempo
+# se sirven los últimos datos buenos y la carga termina en segundo plano
+CONSULTA_TIMEOUT_SEGUNDOS = float(os.environ.get("CONSULTA_TIMEOUT_SEGUNDOS", 5))
+
+# Antes de recargar, sondear cada tabla (filas, última fecha y suma de control) y recargar solo las que cambian
+DETECCION_CAMBIOS = os.environ.get("DETECCION_CAMBIOS", "1") == "1"
+
+# Filas por bloque al leer las tablas con un cursor de servidor (0 = leer cada tabla de una vez)
+CARGA_FILAS_POR_BLOQUE = int(os.environ.get("CARGA_FILAS_POR_BLOQUE", 10000))
+
+# Las tres tablas se cargan en paralelo; una tabla que tarda más que esto se da por fallida
+# (se conservan sus datos anteriores y se vuelve a intentar en la siguiente recarga)
+CARGA_TABLA_TIMEOUT_SEGUNDOS = float(os.environ.get("CARGA_TABLA_TIMEOUT_SEGUNDOS", 120))
+
+# Circuit breaker: tras CIRCUITO_FALLOS_MAX fallos seguidos no se consulta la BD durante
+# CIRCUITO_ESPERA_SEGUNDOS (se duplica en cada intento fallido hasta CIRCUITO_ESPERA_MAX_SEGUNDOS)
+CIRCUITO_FALLOS_MAX = int(os.environ.get("CIRCUITO_FALLOS_MAX", 3))
+CIRCUITO_ESPERA_SEGUNDOS = int(os.environ.get("CIRCUITO_ESPERA_SEGUNDOS", 30))
+CIRCUITO_ESPERA_MAX_SEGUNDOS = 600
 
 TABLA_RANKINGS = "team_stats_angel_ranking"
 TABLA_PARTIDOS = "team_metricas_angel"
 TABLA_FISICAS = "stats_fisicas_team"
 
+# Particiones de los datos por (competición, temporada): si las tres tablas tienen estas columnas,
+# cada partición se carga e indexa por separado y solo se mantienen en memoria las que se consultan
+COLUMNA_COMPETICION = os.environ.get("COLUMNA_COMPETICION", "competitionName")
+COLUMNA_TEMPORADA = os.environ.get("COLUMNA_TEMPORADA", "seasonName")
+COMPETICION_POR_DEFECTO = os.environ.get("COMPETICION_POR_DEFECTO")  # Por defecto, la de la última temporada
+PARTICIONES_EN_MEMORIA = int(os.environ.get("PARTICIONES_EN_MEMORIA", 2))  # Además de la partición por defecto
+PARTICIONES_TTL_SEGUNDOS = 300  # Cada cuánto se vuelve a consultar la lista de particiones
+
+# No cargar las tablas de partidos en memoria: el gráfico de evolución consulta solo los partidos
+# del equipo seleccionado y los guarda en una caché LRU (para históricos largos)
+PARTIDOS_BAJO_DEMANDA = os.environ.get("PARTIDOS_BAJO_DEMANDA", "0") == "1"
+
+# Carga incremental de las tablas de partidos (solo filas con gameDate >= última fecha cargada)
+CARGA_INCREMENTAL = os.environ.get("CARGA_INCREMENTAL", "1") == "1"
+
+# Snapshot local en formato columnar (Arrow IPC / Feather) para arrancar sin esperar a la BD
+# Un único proceso escritor lo genera y todos los workers lo abren mapeado en memoria (solo lectura)
+SNAPSHOT_LOCAL = os.environ.get("SNAPSHOT_LOCAL", "1") == "1"
+SNAPSHOT_DIR = os.environ.get(
+    "SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshot_datos")
+)
+SNAPSHOT_SONDEO_SEGUNDOS = int(os.environ.get("SNAPSHOT_SONDEO_SEGUNDOS", 15))
+SNAPSHOT_VERSIONES_CONSERVADAS = 3
+
+# Renderizar el diagrama en el navegador a partir de una matriz compacta de rankings
+DIAGRAMA_EN_CLIENTE = os.environ.get("DIAGRAMA_EN_CLIENTE", "0") == "1"
+
+# Enviar solo las celdas que cambian al cambiar de equipo (dash.Patch) en lugar del diagrama completo.
+# Desactivado por defecto: con las celdas por clase CSS el Patch apenas ahorra (~15% en una sesión
+# típica, ver --medir-payload) y no pasa por la caché de diagramas ni por la coalescencia
+DIAGRAMA_PARCIAL = os.environ.get("DIAGRAMA_PARCIAL", "0") == "1"
+
+# Redibujar el gráfico de evolución en el navegador al cambiar de métrica
+# (el servidor solo envía los datos por partido del equipo al cambiar de equipo)
+GRAFICO_EN_CLIENTE = os.environ.get("GRAFICO_EN_CLIENTE", "1") == "1"
+
+# Intervalo de recarga de datos en segundo plano (0 = desactivado)
+REFRESCO_DATOS_SEGUNDOS = int(os.environ.get("REFRESCO_DATOS_SEGUNDOS", 3600))
+
+# Directorio donde se exportan todos los diagramas y gráficos como ficheros estáticos tras cada
+# recarga con cambios (vacío = no exportar; también se puede lanzar con `python app.py --exportar`)
+EXPORTACION_DIR = os.environ.get("EXPORTACION_DIR", "")
+
+# Instrumentación de callbacks, consultas y cargas expuesta en /metrics (formato Prometheus)
+METRICAS_ACTIVAS = os.environ.get("METRICAS_ACTIVAS", "1") == "1"
+
+# Calcular los rankings en la app a partir de los valores de las métricas en lugar de usar
+# las columnas *_ranking de la tabla (las que falten se calculan siempre)
+RANKINGS_EN_APP = os.environ.get("RANKINGS_EN_APP", "0") == "1"
+
+# Tratamiento de los empates al calcular rankings: 'min' (1, 2, 2, 4) o 'dense' (1, 2, 2, 3)
+METODO_RANKING = os.environ.get("METODO_RANKING", "min")
+
+# Posiciones del diagrama cuando todavía no hay datos (equipos de la liga)
+NUM_POSICIONES_POR_DEFECTO = 22
+
 # Métricas físicas que requieren tabla especial
 METRICAS_FISICAS = ['Dist_Total', 'Dist_HSR', 'Dist_Sprint']
 
@@ -41,6 +163,7 @@ METRICAS_FISICAS = ['Dist_Total', 'Dist_HSR', 'Dist_Sprint']
 
 # Diagrama de ESTILO GLOBAL (métricas de estilo de juego)
 # Las columnas deben coincidir EXACTAMENTE con las claves de metricas_angel.json
+# 'menor_es_mejor': el ranking 1 es el valor más bajo (si se calculan los rankings en la app)
 ESTILO_CONFIG = {
     'titulo_principal': 'ESTILO GLOBAL',
     'color_principal': '#FFD700',  # Amarillo/Dorado
@@ -56,7 +179,7 @@ ESTILO_CONFIG = {
         {'columna': '%Recuperacion_campo_contrario', 'nombre': '% Recup. Campo Contrario'},
         {'columna': '%Recuperaciones_rapidas', 'nombre': '% Recuperaciones Rápidas'},
         {'columna': 'Ritmo_Recuperación', 'nombre': 'Ritmo Recuperación'},
-        {'columna': 'PPDA', 'nombre': 'PPDA'},
+        {'columna': 'PPDA', 'nombre': 'PPDA', 'menor_es_mejor': True},
         {'columna': 'Altura media recuperacion', 'nombre': 'Altura media recuperacion'},
 
     ]
@@ -74,391 +197,2594 @@ RENDIMIENTO_CONFIG = {
         {'columna': 'Goal_global', 'nombre': 'Goles a Favor'},
         {'columna': 'Eficacia_Contención_Defensiva', 'nombre': 'Eficacia Contención Def. (%)'},
         {'columna': 'Eficacia_Evitacion', 'nombre': 'Eficacia Evitación (%)'},
-        {'columna': 'xG_Contra_NP', 'nombre': 'xG en Contra JD'},
-        {'columna': 'Goal_global_rival', 'nombre': 'Goles en Contra'},
+        {'columna': 'xG_Contra_NP', 'nombre': 'xG en Contra JD', 'menor_es_mejor': True},
+        {'columna': 'Goal_global_rival', 'nombre': 'Goles en Contra', 'menor_es_mejor': True},
         {'columna': 'Dist_Total', 'nombre': 'Distancia Total'},
         {'columna': 'Dist_HSR', 'nombre': 'Dist. HSR (20-25km/h)'},
         {'columna': 'Dist_Sprint', 'nombre': 'Dist. Sprint (>25km/h)'},
         {'columna': '% Duelos Aéreos', 'nombre': '% Duelos Aéreos'},
         {'columna': 'Goles_BP_Favor', 'nombre': 'Goles B.P. Favor'},
         {'columna': 'xG_BP_Favor', 'nombre': 'xG B.P. Favor'},
-        {'columna': 'Goles_BP_Contra', 'nombre': 'Goles B.P. Contra'},
-        {'columna': 'xG_BP_Contra', 'nombre': 'xG B.P. Contra'},
+        {'columna': 'Goles_BP_Contra', 'nombre': 'Goles B.P. Contra', 'menor_es_mejor': True},
+        {'columna': 'xG_BP_Contra', 'nombre': 'xG B.P. Contra', 'menor_es_mejor': True},
     ]
 }
 
 
+# Columnas clave que el dashboard lee además de las métricas
+COLUMNAS_CLAVE = {
+    TABLA_RANKINGS: ['fullName', 'teamId'],
+    TABLA_PARTIDOS: ['gameId', 'gameDate', 'fullName', 'oppFullName'],
+    TABLA_FISICAS: ['gameId', 'gameDate', 'teamId'],
+}
+
+# Columnas de texto repetitivo que se guardan como categóricas
+COLUMNAS_CATEGORICAS = ['fullName', 'oppFullName']
+
+
+def columnas_metricas(configs=None):
+    """Columnas de métricas usadas por los diagramas (sin duplicados ni columnas vacías)"""
+    if configs is None:
+        configs = [ESTILO_CONFIG, RENDIMIENTO_CONFIG]
+    columnas = []
+    for config in configs:
+        for metrica in config['metricas']:
+            if not metrica.get('vacia', False) and metrica['columna'] not in columnas:
+                columnas.append(metrica['columna'])
+    return columnas
+
+
+def plan_columnas(configs=None):
+    """
+    Columnas que necesita el dashboard de cada tabla, derivadas de la configuración de métricas
+    - Rankings: claves + métricas + sus columnas *_ranking
+    - Partidos: claves + métricas no físicas
+    - Físicas: claves + métricas físicas
+    """
+    metricas = columnas_metricas(configs)
+    return {
+        TABLA_RANKINGS: COLUMNAS_CLAVE[TABLA_RANKINGS] + [
+            c for m in metricas for c in (m, f"{m}_ranking")
+        ],
+        TABLA_PARTIDOS: COLUMNAS_CLAVE[TABLA_PARTIDOS] + [
+            m for m in metricas if m not in METRICAS_FISICAS
+        ],
+        TABLA_FISICAS: COLUMNAS_CLAVE[TABLA_FISICAS] + [
+            m for m in metricas if m in METRICAS_FISICAS
+        ],
+    }
+
+
+PLAN_COLUMNAS = plan_columnas()
+
+
 # ============================================================================
-# FUNCIONES DE BASE DE DATOS
+# MÉTRICAS DE RENDIMIENTO (PROMETHEUS)
 # ============================================================================
+# Cada worker mide sus propios callbacks y consultas; la ruta /metrics devuelve
+# los valores de ese worker en formato de texto de Prometheus (el scraper añade
+# la etiqueta de instancia). Con METRICAS_ACTIVAS=0 no se envuelve ninguna función.
 
-def cargar_datos_rankings():
-    """Carga los datos de la tabla de rankings"""
-    try:
-        engine = create_engine(DATABASE_URL, echo=False)
-        query = f"SELECT * FROM {TABLA_RANKINGS}"
-        df = pd.read_sql(query, engine)
-        engine.dispose()
+# Límites de los buckets de los histogramas
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 32768, 65536, 131072, 262144, 524288, 1048576, 4194304)
+
+
+def _etiquetas_prometheus(nombres, valores, extra=''):
+    """Texto {a="x",b="y"} de una serie (escapando comillas, barras y saltos de línea)"""
+    partes = [
+        f'{n}="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for n, v in zip(nombres, valores)
+    ]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+class Contador:
+    """Contador acumulado por combinación de etiquetas (tipo counter de Prometheus)"""
+
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, cantidad=1, *valores):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def exponer(self):
+        with self._lock:
+            valores = dict(self._valores)
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        for clave, valor in sorted(valores.items()):
+            lineas.append(f"{self.nombre}{_etiquetas_prometheus(self.etiquetas, clave)} {valor}")
+        return lineas
+
+
+class Indicador(Contador):
+    """Último valor observado por combinación de etiquetas (tipo gauge de Prometheus)"""
+
+    tipo = 'gauge'
+
+    def fijar(self, valor, *valores):
+        with self._lock:
+            self._valores[valores] = valor
+
+
+class Histograma:
+    """Histograma con buckets fijos por combinación de etiquetas (tipo histogram de Prometheus)"""
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores):
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                # Conteos por bucket (el último es +Inf), suma y total de observaciones
+                serie = self._series[valores] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exponer(self):
+        with self._lock:
+            series = {clave: (list(conteos), suma, total) for clave, (conteos, suma, total) in self._series.items()}
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for clave, (conteos, suma, total) in sorted(series.items()):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + ('+Inf',), conteos):
+                acumulado += conteo
+                le = _etiquetas_prometheus(self.etiquetas, clave, f'le="{limite}"')
+                lineas.append(f"{self.nombre}_bucket{le} {acumulado}")
+            etiquetas = _etiquetas_prometheus(self.etiquetas, clave)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {suma}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {total}")
+        return lineas
+
+
+metrica_callback_segundos = Histograma(
+    'dashboard_callback_duracion_segundos', 'Duración de los callbacks de Dash', ('callback',))
+metrica_callback_bytes = Histograma(
+    'dashboard_callback_respuesta_bytes', 'Tamaño de la respuesta de los callbacks de Dash',
+    ('callback',), BUCKETS_BYTES)
+metrica_callback_errores = Contador(
+    'dashboard_callback_errores_total', 'Callbacks de Dash terminados con excepción', ('callback',))
+metrica_consulta_segundos = Histograma(
+    'dashboard_consulta_duracion_segundos', 'Duración de las consultas a la base de datos', ('tabla',))
+metrica_consulta_filas = Contador(
+    'dashboard_consulta_filas_total', 'Filas leídas de la base de datos', ('tabla',))
+metrica_carga_segundos = Histograma(
+    'dashboard_carga_duracion_segundos', 'Duración de los cargadores cargar_datos_*', ('cargador',))
+metrica_carga_filas = Indicador(
+    'dashboard_carga_filas', 'Filas del DataFrame devuelto por la última carga', ('cargador',))
+
+
+def instrumentar_carga(funcion):
+    """Mide la duración y las filas devueltas por un cargador cargar_datos_*"""
+    if not METRICAS_ACTIVAS:
+        return funcion
+    
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        inicio = time.perf_counter()
+        df = funcion(*args, **kwargs)
+        metrica_carga_segundos.observar(time.perf_counter() - inicio, funcion.__name__)
+        metrica_carga_filas.fijar(len(df), funcion.__name__)
         return df
-    except Exception as e:
-        print(f"Error al cargar datos rankings: {e}")
+    
+    return envoltura
+
+
+def instrumentar_callback(funcion):
+    """
+    Mide la duración y los errores de un callback de Dash; el tamaño de la respuesta se
+    anota al terminar la petición (ver registrar_bytes_callback)
+    """
+    if not METRICAS_ACTIVAS:
+        return funcion
+    
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        flask.g.callback_instrumentado = funcion.__name__
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        except Exception:
+            metrica_callback_errores.incrementar(1, funcion.__name__)
+            raise
+        finally:
+            metrica_callback_segundos.observar(time.perf_counter() - inicio, funcion.__name__)
+    
+    return envoltura
+
+
+def registrar_bytes_callback(respuesta):
+    """after_request de Flask: tamaño del JSON devuelto por el callback instrumentado"""
+    nombre = flask.g.pop('callback_instrumentado', None)
+    if nombre is not None:
+        tamano = respuesta.content_length
+        if tamano is None:
+            tamano = len(respuesta.get_data())
+        metrica_callback_bytes.observar(tamano, nombre)
+    return respuesta
+
+
+def exponer_metricas():
+    """Texto de /metrics: métricas instrumentadas y estadísticas de las cachés de resultados"""
+    lineas = []
+    for metrica in (metrica_callback_segundos, metrica_callback_bytes, metrica_callback_errores,
+                    metrica_consulta_segundos, metrica_consulta_filas,
+                    metrica_carga_segundos, metrica_carga_filas):
+        lineas.extend(metrica.exponer())
+    
+    # Las cachés ya cuentan aciertos y fallos; se leen al exponer, sin coste en los callbacks
+    caches = estadisticas_caches()
+    for nombre, tipo, campo, ayuda in (
+        ('dashboard_cache_aciertos_total', 'counter', 'aciertos', 'Aciertos de la caché de resultados'),
+        ('dashboard_cache_fallos_total', 'counter', 'fallos', 'Fallos de la caché de resultados'),
+        ('dashboard_cache_entradas', 'gauge', 'entradas', 'Entradas en la caché de resultados'),
+        ('dashboard_cache_tasa_aciertos', 'gauge', 'tasa_aciertos', 'Proporción de aciertos de la caché'),
+    ):
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+        lineas += [f'{nombre}{{cache="{cache}"}} {stats[campo]}' for cache, stats in sorted(caches.items())]
+
+    # Cálculos de los callbacks hechos en este worker y peticiones que reutilizaron otro en curso
+    vuelos = vuelos_callbacks.estadisticas()
+    nombre = 'dashboard_coalescencia_total'
+    lineas += [f"# HELP {nombre} Cálculos de callbacks hechos o compartidos con otra petición en curso",
+               f"# TYPE {nombre} counter"]
+    lineas += [f'{nombre}{{resultado="{campo}"}} {vuelos[campo]}'
+               for campo in ('calculados', 'coalescidos', 'leidos_de_otro_worker')]
+
+    # Antigüedad de los datos servidos y estado de la base de datos
+    momento = momento_datos(obtener_snapshot())
+    circuito = circuito_bd.estado()
+    for nombre, valor, ayuda in (
+        ('dashboard_datos_edad_segundos', time.time() - momento if momento is not None else 'NaN',
+         'Segundos desde que se leyeron o comprobaron con la BD los datos vigentes'),
+        ('dashboard_bd_circuito_abierto', int(circuito['estado'] != 'cerrado'),
+         'El circuit breaker de la BD no está cerrado (1) o sí (0)'),
+        ('dashboard_bd_fallos_seguidos', circuito['fallos_seguidos'], 'Fallos seguidos de la BD'),
+    ):
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge", f"{nombre} {valor}"]
+    return '\n'.join(lineas) + '\n'
+
+
+# ============================================================================
+# FUNCIONES DE BASE DE DATOS
+# ============================================================================
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def crear_engine_compartido(url=None):
+    """
+    Crea el engine con pool de conexiones (pre-ping, reciclado y límites de tamaño)
+    Con SQLite (entornos locales y pruebas) se usa el pool por defecto del dialecto
+    """
+    url = make_url(url or DATABASE_URL)
+    opciones = {'echo': False, 'pool_pre_ping': True}
+    if url.get_backend_name() != 'sqlite':
+        opciones.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    if url.get_backend_name() == 'mysql':
+        opciones['connect_args'] = {
+            'connect_timeout': DB_TIMEOUT_CONEXION,
+            'read_timeout': DB_TIMEOUT_LECTURA,
+        }
+    return create_engine(url, **opciones)
+
+
+def obtener_engine():
+    """Devuelve el engine compartido del proceso (se crea la primera vez que se usa)"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = crear_engine_compartido()
+    return _engine
+
+
+def _reiniciar_engine_tras_fork():
+    """Los procesos hijos no deben reutilizar las conexiones heredadas del padre"""
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_engine_tras_fork)
+
+
+def leer_consulta(consulta, parametros=None):
+    """Ejecuta una consulta SELECT sobre el pool compartido y devuelve un DataFrame"""
+    with obtener_engine().connect() as conexion:
+        return pd.read_sql(text(consulta), conexion, params=parametros)
+
+
+def obtener_columnas_tabla(tabla):
+    """Nombres de las columnas que existen realmente en la tabla"""
+    return [c['name'] for c in inspect(obtener_engine()).get_columns(tabla)]
+
+
+def columnas_disponibles(tabla, columnas):
+    """Columnas del plan que existen en la tabla (las que falten se mostrarán como no disponibles)"""
+    existentes = set(obtener_columnas_tabla(tabla))
+    return [c for c in columnas if c in existentes]
+
+
+def consulta_tabla(tabla, columnas=None, orden=None, desde=None, filtros=None):
+    """
+    SELECT (y sus parámetros) de una tabla, opcionalmente proyectando solo algunas columnas y ordenada por una columna
+    Con `desde` solo se leen las filas cuya columna de orden es >= ese valor
+    Con `filtros` ({columna: valor}) solo las filas con esos valores (p. ej. una partición)
+    """
+    preparer = obtener_engine().dialect.identifier_preparer
+    if columnas is None:
+        seleccion = "*"
+    else:
+        seleccion = ", ".join(preparer.quote(c) for c in columnas)
+    consulta = f"SELECT {seleccion} FROM {preparer.quote(tabla)}"
+    condiciones = []
+    parametros = {}
+    for i, (columna, valor) in enumerate((filtros or {}).items()):
+        condiciones.append(f"{preparer.quote(columna)} = :filtro_{i}")
+        parametros[f"filtro_{i}"] = valor
+    if desde is not None:
+        condiciones.append(f"{preparer.quote(orden)} >= :desde")
+        parametros['desde'] = desde
+    if condiciones:
+        consulta += " WHERE " + " AND ".join(condiciones)
+    parametros = parametros or None
+    if orden:
+        consulta += f" ORDER BY {preparer.quote(orden)}"
+    return consulta, parametros
+
+
+def leer_tabla(tabla, columnas=None, orden=None, desde=None, filtros=None):
+    """Lee una tabla completa en un DataFrame (ver consulta_tabla)"""
+    consulta, parametros = consulta_tabla(tabla, columnas, orden, desde, filtros)
+    if not METRICAS_ACTIVAS:
+        return leer_consulta(consulta, parametros)
+    
+    inicio = time.perf_counter()
+    df = leer_consulta(consulta, parametros)
+    metrica_consulta_segundos.observar(time.perf_counter() - inicio, tabla)
+    metrica_consulta_filas.incrementar(len(df), tabla)
+    return df
+
+
+def leer_tabla_por_bloques(tabla, columnas=None, orden=None, desde=None, filtros=None,
+                           filas_por_bloque=CARGA_FILAS_POR_BLOQUE, medidas=None):
+    """
+    Lee una tabla (ver consulta_tabla) en bloques de `filas_por_bloque` filas con un cursor de servidor
+    (stream_results): el driver no trae todo el resultado a memoria, y cada bloque se compacta antes
+    de pedir el siguiente, así que solo hay un bloque de filas Python a la vez
+    Generador de DataFrames ya compactados (compactar_tipos); en `medidas['mb_leidos']` se acumula
+    la memoria de los bloques antes de compactarlos
+    """
+    consulta, parametros = consulta_tabla(tabla, columnas, orden, desde, filtros)
+    inicio = time.perf_counter()
+    filas = 0
+    with obtener_engine().connect() as conexion:
+        conexion = conexion.execution_options(stream_results=True, yield_per=filas_por_bloque)
+        for bloque in pd.read_sql(text(consulta), conexion, params=parametros, chunksize=filas_por_bloque):
+            filas += len(bloque)
+            if medidas is not None:
+                medidas['mb_leidos'] = medidas.get('mb_leidos', 0.0) + memoria_mb(bloque)
+            yield compactar_tipos(bloque)
+    if METRICAS_ACTIVAS:
+        metrica_consulta_segundos.observar(time.perf_counter() - inicio, tabla)
+        metrica_consulta_filas.incrementar(filas, tabla)
+
+
+def compactar_tipos(df):
+    """
+    Reduce la memoria del DataFrame: rankings e ids a enteros pequeños,
+    métricas a float32 y nombres de equipos a categóricas
+    """
+    df = df.copy()
+    for columna in df.columns:
+        serie = df[columna]
+        if columna in COLUMNAS_CATEGORICAS:
+            df[columna] = serie.astype('category')
+        elif not pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+            continue
+        elif columna.endswith('_ranking') or columna in ('teamId', 'gameId'):
+            if serie.isna().any():
+                df[columna] = serie.astype('float32')
+            else:
+                df[columna] = pd.to_numeric(serie, downcast='integer')
+        else:
+            df[columna] = serie.astype('float32')
+    return df
+
+
+def concatenar_tablas(partes):
+    """
+    Concatena DataFrames compactados conservando las columnas categóricas
+    (se unifican las categorías para que pandas no las convierta a object)
+    """
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return pd.DataFrame()
+    if len(partes) == 1:
+        return partes[0]
+    
+    partes = [p.copy() for p in partes]
+    for columna in COLUMNAS_CATEGORICAS:
+        if all(columna in p.columns and isinstance(p[columna].dtype, pd.CategoricalDtype) for p in partes):
+            categorias = pd.api.types.union_categoricals([p[columna] for p in partes]).categories
+            for p in partes:
+                p[columna] = p[columna].cat.set_categories(categorias)
+    return pd.concat(partes, ignore_index=True)
+
+
+def concatenar_bloques(bloques):
+    """
+    Une los bloques compactados de leer_tabla_por_bloques en un único DataFrame, columna a columna:
+    cada columna se copia una sola vez a su array final (sin el DataFrame intermedio de pd.concat)
+    Las categóricas se unen con categorías ordenadas y los tipos coinciden con los de compactar_tipos
+    sobre la tabla entera (un bloque sin valores en una columna numérica no la convierte en object)
+    """
+    if not bloques:
         return pd.DataFrame()
+    if len(bloques) == 1:
+        return bloques[0]
+    
+    columnas = {}
+    for columna in bloques[0].columns:
+        series = [bloque[columna] for bloque in bloques]
+        if all(isinstance(serie.dtype, pd.CategoricalDtype) for serie in series):
+            columnas[columna] = pd.api.types.union_categoricals(
+                [serie.array for serie in series], sort_categories=True)
+            continue
+        
+        arrays = [serie.to_numpy() for serie in series]
+        numericos = [a for a in arrays if a.dtype.kind in 'iuf']
+        if numericos and len(numericos) < len(arrays):
+            # Bloques sin ningún valor en la columna: pandas los deja como object (None)
+            arrays = [a if a.dtype.kind in 'iuf' else np.full(len(a), np.nan, dtype='float32') for a in arrays]
+        tipos = {a.dtype for a in arrays}
+        if len(tipos) > 1 and any(t.kind == 'f' for t in tipos):
+            # Enteros en unos bloques y NaN en otros: float32, como compactar_tipos con la tabla entera
+            arrays = [a.astype('float32', copy=False) for a in arrays]
+        columnas[columna] = np.concatenate(arrays)
+    return pd.DataFrame(columnas, copy=False)
+
+
+def pico_rss_mb():
+    """Pico de memoria residente del proceso (MB) o None si no se puede medir (Windows)"""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024  # bytes en macOS, KB en Linux
+
+
+def memoria_mb(df):
+    """Memoria ocupada por un DataFrame en MB (incluyendo cadenas)"""
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def leer_tabla_compacta(tabla, columnas, orden=None, desde=None, filtros=None, medidas=None):
+    """
+    Lee una tabla y compacta sus tipos: por bloques (CARGA_FILAS_POR_BLOQUE) o, si está a 0, entera
+    Devuelve el DataFrame y el número de bloques leídos; con `medidas`, en 'mb_leidos' queda la memoria
+    de lo leído antes de compactar
+    """
+    if CARGA_FILAS_POR_BLOQUE <= 0:
+        df = leer_tabla(tabla, columnas=columnas, orden=orden, desde=desde, filtros=filtros)
+        if medidas is not None:
+            medidas['mb_leidos'] = memoria_mb(df)
+        return compactar_tipos(df), 1
+    bloques = list(leer_tabla_por_bloques(
+        tabla, columnas=columnas, orden=orden, desde=desde, filtros=filtros, medidas=medidas))
+    if not bloques:
+        return pd.DataFrame(columns=columnas), 0
+    return concatenar_bloques(bloques), len(bloques)
+
+
+def cargar_tabla_compacta(tabla, orden=None, filtros=None):
+    """Carga las columnas del plan de una tabla, compacta sus tipos e informa de la memoria y del pico de RSS"""
+    columnas = columnas_disponibles(tabla, PLAN_COLUMNAS[tabla])
+    medidas = {'mb_leidos': 0.0}
+    df, num_bloques = leer_tabla_compacta(tabla, columnas, orden=orden, filtros=filtros, medidas=medidas)
+    pico = pico_rss_mb()
+    print(f"{tabla}: {len(df)} filas x {len(df.columns)} columnas en {num_bloques} bloque(s), "
+          f"{medidas['mb_leidos']:.2f} MB -> {memoria_mb(df):.2f} MB"
+          + (f" (pico RSS del proceso {pico:.0f} MB)" if pico is not None else ""))
+    return df
+
+
+def _valor_parametro(valor):
+    """Convierte un valor de pandas en un parámetro aceptado por el driver"""
+    return valor.to_pydatetime() if hasattr(valor, 'to_pydatetime') else valor
+
+
+def diferencia_con_bd(df, agregados, orden, marca):
+    """
+    Motivo por el que una carga incremental no coincide con los agregados sondeados de la tabla
+    (ver agregados_tabla), o None si coincide. Si la tabla cambió sin fechas nuevas, el cambio
+    (un borrado o una corrección de filas anteriores a la marca de agua) no se puede localizar
+    """
+    if len(df) != agregados['filas']:
+        return f"{len(df)} filas en memoria frente a {agregados['filas']} en la BD"
+    for columna, suma in agregados['sumas'].items():
+        if columna in df.columns and suma is not None and not np.isclose(
+                df[columna].astype('float64').sum(), float(suma), rtol=1e-9, atol=0):
+            return f"la suma de {columna} no coincide con la BD"
+    if df.empty or not df[orden].max() > marca:
+        return "cambios sin fechas nuevas"
+    return None
+
+
+def cargar_tabla_incremental(tabla, df_anterior, orden='gameDate', filtros=None, agregados=None):
+    """
+    Carga solo las filas nuevas de una tabla de partidos a partir de la marca de agua
+    (la mayor gameDate ya cargada). Las filas de esa última fecha se vuelven a leer
+    para recoger partidos de la jornada que llegaron tarde o se corrigieron.
+    Si cambia el esquema (columnas del plan) o no hay datos previos se hace una carga completa.
+    Con los `agregados` del sondeo, si el resultado no coincide con ellos (borrados o correcciones
+    anteriores a la marca) también se hace una carga completa.
+    """
+    columnas = columnas_disponibles(tabla, PLAN_COLUMNAS[tabla])
+    if df_anterior.empty or list(df_anterior.columns) != columnas or orden not in columnas:
+        print(f"{tabla}: resincronización completa")
+        return cargar_tabla_compacta(tabla, orden=orden, filtros=filtros)
+    
+    marca = df_anterior[orden].max()
+    nuevas, _ = leer_tabla_compacta(tabla, columnas, orden=orden, desde=_valor_parametro(marca), filtros=filtros)
+    conservadas = df_anterior[df_anterior[orden] < marca]
+    df = concatenar_tablas([conservadas, nuevas])
+    motivo = diferencia_con_bd(df, agregados, orden, marca) if agregados is not None else None
+    if motivo:
+        print(f"{tabla}: {motivo}, resincronización completa")
+        return cargar_tabla_compacta(tabla, orden=orden, filtros=filtros)
+    print(f"{tabla}: carga incremental desde {marca} "
+          f"({len(nuevas)} filas leídas, {len(df) - len(df_anterior):+d} filas)")
+    return df
+
+
+def filtros_particion(particion):
+    """Filtros de leer_tabla para una partición (competición, temporada); sin partición, ninguno"""
+    if particion is None:
+        return None
+    competicion, temporada = particion
+    return {COLUMNA_COMPETICION: competicion, COLUMNA_TEMPORADA: temporada}
+
+
+def listar_particiones():
+    """
+    Particiones (competición, temporada) de la tabla de rankings, de la temporada más reciente
+    a la más antigua. Lista vacía si las tablas no tienen las columnas de partición.
+    """
+    columnas_particion = {COLUMNA_COMPETICION, COLUMNA_TEMPORADA}
+    for tabla in (TABLA_RANKINGS, TABLA_PARTIDOS, TABLA_FISICAS):
+        if not columnas_particion <= set(obtener_columnas_tabla(tabla)):
+            return []
+    
+    preparer = obtener_engine().dialect.identifier_preparer
+    competicion = preparer.quote(COLUMNA_COMPETICION)
+    temporada = preparer.quote(COLUMNA_TEMPORADA)
+    df = leer_consulta(
+        f"SELECT DISTINCT {competicion}, {temporada} FROM {preparer.quote(TABLA_RANKINGS)} "
+        f"ORDER BY {temporada} DESC, {competicion}"
+    )
+    return [tuple(fila) for fila in df.itertuples(index=False, name=None)]
+
+
+def agregados_tabla(tabla, orden=None, columnas_suma=(), filtros=None):
+    """
+    Agregados baratos de una tabla (o de una partición) en una sola consulta: número de filas, máximo de
+    `orden` y sumas de `columnas_suma`; en MySQL también la hora de la última modificación de la tabla
+    (information_schema, puede ser NULL)
+    """
+    engine = obtener_engine()
+    q = engine.dialect.identifier_preparer.quote
+    agregados = ["COUNT(*)"]
+    if orden:
+        agregados.append(f"MAX({q(orden)})")
+    agregados += [f"SUM({q(columna)})" for columna in columnas_suma]
+    consulta = f"SELECT {', '.join(agregados)} FROM {q(tabla)}"
+    condiciones = []
+    parametros = {}
+    for i, (columna, valor) in enumerate((filtros or {}).items()):
+        condiciones.append(f"{q(columna)} = :filtro_{i}")
+        parametros[f"filtro_{i}"] = valor
+    if condiciones:
+        consulta += " WHERE " + " AND ".join(condiciones)
+    
+    modificada = None
+    with engine.connect() as conexion:
+        valores = list(conexion.execute(text(consulta), parametros).one())
+        if engine.dialect.name == 'mysql':
+            modificada = conexion.execute(text(
+                "SELECT UPDATE_TIME FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :tabla"
+            ), {'tabla': tabla}).scalar()
+    
+    filas = valores.pop(0)
+    maximo = valores.pop(0) if orden else None
+    return {'filas': filas, 'maximo': maximo, 'sumas': dict(zip(columnas_suma, valores)), 'modificada': modificada}
+
 
+def huella_agregados(agregados):
+    """
+    Huella de los agregados de una tabla (ver agregados_tabla): si no cambia, los datos tampoco
+    (salvo correcciones que no muevan ninguno de esos valores)
+    """
+    valores = [agregados['filas'], agregados['maximo'], *agregados['sumas'].values(), agregados['modificada']]
+    # Las sumas de float se redondean: el orden de acumulación puede cambiar los últimos decimales
+    texto = '|'.join(f"{v:.6g}" if isinstance(v, float) else str(v) for v in valores)
+    return hashlib.md5(texto.encode('utf-8')).hexdigest()[:16]
 
-def cargar_datos_partidos():
-    """Carga los datos de partidos individuales"""
+
+def sondear_tablas(particion=None):
+    """
+    Huella de cada tabla (ver huella_agregados), o None si no se pudo sondear (se recarga siempre),
+    y sus agregados, con los que se comprueban las cargas incrementales
+    Rankings: sumas de las métricas y de sus rankings (pocas filas por partición); partidos y físicas:
+    filas, última fecha y suma de gameId
+    """
+    filtros = filtros_particion(particion)
     try:
-        engine = create_engine(DATABASE_URL, echo=False)
-        query = f"SELECT * FROM {TABLA_PARTIDOS} ORDER BY gameDate"
-        df = pd.read_sql(query, engine)
-        engine.dispose()
-        return df
+        metricas = columnas_disponibles(
+            TABLA_RANKINGS, [c for m in columnas_metricas() for c in (m, f"{m}_ranking")])
     except Exception as e:
-        print(f"Error al cargar datos partidos: {e}")
-        return pd.DataFrame()
+        print(f"Error al sondear las tablas: {e}")
+        return {'rankings': None, 'partidos': None, 'fisicas': None}, {}
+    sondeos = {
+        'rankings': (TABLA_RANKINGS, None, metricas),
+        'partidos': (TABLA_PARTIDOS, 'gameDate', ['gameId']),
+        'fisicas': (TABLA_FISICAS, 'gameDate', ['gameId']),
+    }
+    huellas = {}
+    agregados = {}
+    inicio = time.perf_counter()
+    for nombre, (tabla, orden, columnas_suma) in sondeos.items():
+        try:
+            agregados[nombre] = agregados_tabla(tabla, orden, columnas_suma, filtros)
+            huellas[nombre] = huella_agregados(agregados[nombre])
+        except Exception as e:
+            print(f"Error al sondear {tabla}: {e}")
+            huellas[nombre] = None
+    if METRICAS_ACTIVAS:
+        metrica_consulta_segundos.observar(time.perf_counter() - inicio, 'sondeo')
+    return huellas, agregados
 
 
-def cargar_datos_fisicas():
-    """Carga los datos de métricas físicas por partido"""
+def leer_partidos_equipo(equipo, team_id, columnas_partidos, columnas_fisicas, filtros=None):
+    """
+    Partidos y métricas físicas de un solo equipo, ordenados por fecha (consultas parametrizadas)
+    A las físicas se les une el nombre del rival desde la tabla de partidos (mismo partido y equipo)
+    """
+    preparer = obtener_engine().dialect.identifier_preparer
+    q = preparer.quote
+    parametros = {'equipo': equipo, 'team_id': team_id}
+    condiciones_partidos = [f"{q('fullName')} = :equipo"]
+    condiciones_fisicas = [f"f.{q('teamId')} = :team_id"]
+    for i, (columna, valor) in enumerate((filtros or {}).items()):
+        condiciones_partidos.append(f"{q(columna)} = :filtro_{i}")
+        condiciones_fisicas.append(f"f.{q(columna)} = :filtro_{i}")
+        parametros[f"filtro_{i}"] = valor
+    
+    partidos = leer_consulta(
+        f"SELECT {', '.join(q(c) for c in columnas_partidos)} FROM {q(TABLA_PARTIDOS)} "
+        f"WHERE {' AND '.join(condiciones_partidos)} ORDER BY {q('gameDate')}",
+        parametros,
+    )
+    
+    fisicas = pd.DataFrame()
+    if team_id is not None and columnas_fisicas:
+        rivales = (
+            f"SELECT DISTINCT {q('gameId')}, {q('oppFullName')} FROM {q(TABLA_PARTIDOS)} "
+            f"WHERE {' AND '.join(condiciones_partidos)}"
+        )
+        fisicas = leer_consulta(
+            f"SELECT {', '.join('f.' + q(c) for c in columnas_fisicas)}, r.{q('oppFullName')} "
+            f"FROM {q(TABLA_FISICAS)} f LEFT JOIN ({rivales}) r ON r.{q('gameId')} = f.{q('gameId')} "
+            f"WHERE {' AND '.join(condiciones_fisicas)} ORDER BY f.{q('gameDate')}",
+            parametros,
+        )
+    return partidos, fisicas
+
+
+@instrumentar_carga
+def cargar_datos_rankings(particion=None):
+    """Carga los datos de la tabla de rankings (de una partición si se indica)"""
     try:
-        engine = create_engine(DATABASE_URL, echo=False)
-        query = f"SELECT * FROM {TABLA_FISICAS} ORDER BY gameDate"
-        df = pd.read_sql(query, engine)
-        engine.dispose()
-        return df
+        return cargar_tabla_compacta(TABLA_RANKINGS, filtros=filtros_particion(particion))
     except Exception as e:
-        print(f"Error al cargar datos físicas: {e}")
+        print(f"Error al cargar datos rankings: {e}")
         return pd.DataFrame()
 
 
+@instrumentar_carga
+def cargar_datos_partidos(anterior=None, particion=None, agregados=None):
+    """
+    Carga los datos de partidos individuales
+    Con `anterior` (y CARGA_INCREMENTAL activa) solo se leen las filas nuevas. Con los `agregados` del
+    sondeo se comprueba que el resultado coincide con la tabla (si no, se carga entera).
+    Si la carga falla lanza la excepción: cargar_snapshot conserva los datos y la huella anteriores.
+    Con `particion` solo se leen los partidos de esa (competición, temporada)
+    """
+    filtros = filtros_particion(particion)
+    if anterior is not None and CARGA_INCREMENTAL:
+        return cargar_tabla_incremental(TABLA_PARTIDOS, anterior, filtros=filtros, agregados=agregados)
+    return cargar_tabla_compacta(TABLA_PARTIDOS, orden='gameDate', filtros=filtros)
+
+
+@instrumentar_carga
+def cargar_datos_fisicas(anterior=None, particion=None, agregados=None):
+    """
+    Carga los datos de métricas físicas por partido
+    Con `anterior` (y CARGA_INCREMENTAL activa) solo se leen las filas nuevas. Con los `agregados` del
+    sondeo se comprueba que el resultado coincide con la tabla (si no, se carga entera).
+    Si la carga falla lanza la excepción: cargar_snapshot conserva los datos y la huella anteriores.
+    Con `particion` solo se leen los partidos de esa (competición, temporada)
+    """
+    filtros = filtros_particion(particion)
+    if anterior is not None and CARGA_INCREMENTAL:
+        return cargar_tabla_incremental(TABLA_FISICAS, anterior, filtros=filtros, agregados=agregados)
+    return cargar_tabla_compacta(TABLA_FISICAS, orden='gameDate', filtros=filtros)
+
+
 # ============================================================================
-# FUNCIONES DE VISUALIZACIÓN
+# PROTECCIÓN FRENTE A UNA BASE DE DATOS LENTA O CAÍDA
 # ============================================================================
+#
+# Las cargas se ejecutan en un pool de hilos: quien las pide espera como mucho un timeout y,
+# si no hay respuesta, sigue con los últimos datos buenos (la carga termina en segundo plano).
+# Tras varios fallos seguidos el circuito se abre y no se consulta la BD durante un tiempo,
+# así que ni los callbacks ni el arranque se quedan esperando a una BD caída.
 
-def get_color_by_ranking(ranking):
-    """Retorna el color según la posición en el ranking"""
-    if ranking <= 6:
-        return '#00B050'  # Verde
-    elif ranking <= 16:
-        return '#FFD700'  # Amarillo
-    else:
-        return '#FF0000'  # Rojo
+class CircuitoBD:
+    """
+    Circuit breaker de las consultas a la base de datos
+    cerrado -> se consulta; abierto (tras `max_fallos` fallos seguidos) -> no se consulta durante
+    la espera; pasada la espera se deja pasar una única consulta de prueba (semiabierto): si sale
+    bien se cierra y si falla se vuelve a abrir con el doble de espera (hasta `espera_max`)
+    """
+    def __init__(self, max_fallos=CIRCUITO_FALLOS_MAX, espera=CIRCUITO_ESPERA_SEGUNDOS,
+                 espera_max=CIRCUITO_ESPERA_MAX_SEGUNDOS):
+        self.max_fallos = max(1, max_fallos)
+        self.espera_base = espera
+        self.espera_max = max(espera, espera_max)
+        self.espera = espera
+        self.fallos_seguidos = 0
+        self.abierto_hasta = 0.0
+        self.prueba_en_curso = False
+        self.ultimo_error = None
+        self.ultimo_exito = None
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """Indica si se puede consultar la BD ahora (en semiabierto, solo a la consulta de prueba)"""
+        with self._lock:
+            if self.fallos_seguidos < self.max_fallos:
+                return True
+            if self.prueba_en_curso or time.monotonic() < self.abierto_hasta:
+                return False
+            self.prueba_en_curso = True
+            return True
+
+    def exito(self):
+        with self._lock:
+            self.fallos_seguidos = 0
+            self.espera = self.espera_base
+            self.prueba_en_curso = False
+            self.ultimo_exito = time.time()
+
+    def fallo(self, error):
+        with self._lock:
+            self.fallos_seguidos += 1
+            self.ultimo_error = str(error)
+            if self.fallos_seguidos >= self.max_fallos:
+                if self.prueba_en_curso:
+                    self.espera = min(self.espera * 2, self.espera_max)
+                self.abierto_hasta = time.monotonic() + self.espera
+            self.prueba_en_curso = False
+
+    @property
+    def abierto(self):
+        """El circuito no está cerrado (la BD ha fallado varias veces seguidas)"""
+        return self.fallos_seguidos >= self.max_fallos
+
+    def segundos_para_reintentar(self):
+        """Segundos que faltan para poder volver a consultar la BD (0 si el circuito está cerrado)"""
+        if not self.abierto:
+            return 0.0
+        return max(0.0, self.abierto_hasta - time.monotonic())
+
+    def estado(self):
+        """Resumen del circuito (para /estadisticas-cache y /metrics)"""
+        with self._lock:
+            if self.fallos_seguidos < self.max_fallos:
+                estado = 'cerrado'
+            elif self.prueba_en_curso or time.monotonic() >= self.abierto_hasta:
+                estado = 'semiabierto'
+            else:
+                estado = 'abierto'
+            return {
+                'estado': estado,
+                'fallos_seguidos': self.fallos_seguidos,
+                'espera_segundos': self.espera,
+                'ultimo_error': self.ultimo_error,
+                'ultimo_exito': self.ultimo_exito,
+            }
+
+
+circuito_bd = CircuitoBD()
+
+_ejecutores = {}
+_ejecutores_lock = threading.Lock()
+
+
+def obtener_ejecutor(nombre, max_hilos):
+    """
+    Pool de hilos con nombre, uno por proceso: tras un fork los hilos del padre
+    no existen en el hijo y el pool se vuelve a crear
+    """
+    clave = (nombre, os.getpid())
+    ejecutor = _ejecutores.get(clave)
+    if ejecutor is None:
+        with _ejecutores_lock:
+            ejecutor = _ejecutores.get(clave)
+            if ejecutor is None:
+                ejecutor = concurrent.futures.ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix=nombre)
+                _ejecutores[clave] = ejecutor
+    return ejecutor
+
+
+def obtener_ejecutor_bd():
+    """Pool de hilos de las cargas protegidas (ver consultar_bd)"""
+    return obtener_ejecutor('consulta-bd', DB_POOL_SIZE + DB_MAX_OVERFLOW)
+
+
+def consultar_bd(funcion, *args, timeout=CONSULTA_TIMEOUT_SEGUNDOS, valido=None, completo=None,
+                 al_terminar_tarde=None, descripcion='Consulta'):
+    """
+    Ejecuta `funcion(*args)` (una carga de la BD) a través del circuit breaker y con timeout
+    Devuelve su resultado, o None si el circuito está abierto, la carga lanza una excepción,
+    el resultado no es `valido` o no termina en `timeout` segundos (None = sin límite).
+    Un resultado válido pero no `completo` (p. ej. una carga parcial) se devuelve y cuenta como fallo.
+    Una carga que termina después del timeout sigue contando para el circuito y, si es válida,
+    se entrega a `al_terminar_tarde` (p. ej. para publicarla o cachearla)
+    """
+    if not circuito_bd.permitir():
+        return None
+    vencida = threading.Event()
+
+    def ejecutar():
+        try:
+            resultado = funcion(*args)
+            if valido is not None and not valido(resultado):
+                raise RuntimeError("la carga no ha devuelto datos")
+        except Exception as e:
+            print(f"{descripcion}: error de la base de datos: {e}")
+            circuito_bd.fallo(e)
+            return None
+        if completo is not None and not completo(resultado):
+            circuito_bd.fallo(RuntimeError(f"{descripcion}: carga incompleta"))
+        else:
+            circuito_bd.exito()
+        if vencida.is_set() and al_terminar_tarde is not None:
+            try:
+                al_terminar_tarde(resultado)
+            except Exception as e:
+                print(f"{descripcion}: error al usar la carga terminada en segundo plano: {e}")
+        return resultado
+
+    futuro = obtener_ejecutor_bd().submit(ejecutar)
+    try:
+        return futuro.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        vencida.set()
+        if futuro.done():  # Ha terminado justo al vencer el timeout
+            return futuro.result()
+        print(f"{descripcion}: la base de datos no ha respondido en {timeout:g}s, se sirven los últimos datos")
+        return None
+
+
+_revalidaciones = set()
+_revalidaciones_lock = threading.Lock()
+
+
+def revalidar_en_segundo_plano(clave, funcion, *args, **kwargs):
+    """
+    Ejecuta `funcion(*args, **kwargs)` en un hilo aparte sin esperar el resultado (stale-while-revalidate)
+    Como mucho una revalidación a la vez por `clave`; las peticiones siguen con los datos que tienen
+    """
+    with _revalidaciones_lock:
+        if clave in _revalidaciones:
+            return False
+        _revalidaciones.add(clave)
+
+    def revalidar():
+        try:
+            funcion(*args, **kwargs)
+        except Exception as e:
+            print(f"Error al revalidar {clave}: {e}")
+        finally:
+            with _revalidaciones_lock:
+                _revalidaciones.discard(clave)
+
+    threading.Thread(target=revalidar, name=f"revalidar-{clave}", daemon=True).start()
+    return True
+
+
+# ============================================================================
+# CACHÉ DE RESULTADOS
+# ============================================================================
+
+# Tamaño máximo de la caché de diagramas (22 equipos x 2 diagramas caben de sobra)
+CACHE_DIAGRAMAS_MAX = int(os.environ.get("CACHE_DIAGRAMAS_MAX", 128))
+
+# Tamaño máximo de la caché de figuras de evolución (equipo x métrica x diagrama)
+CACHE_GRAFICOS_MAX = int(os.environ.get("CACHE_GRAFICOS_MAX", 256))
+
+# Equipos cuyos partidos se mantienen en memoria con PARTIDOS_BAJO_DEMANDA
+CACHE_PARTIDOS_EQUIPO_MAX = int(os.environ.get("CACHE_PARTIDOS_EQUIPO_MAX", 32))
+
+# Peticiones idénticas simultáneas de distintos workers esperan un único cálculo (lock y resultado
+# en ficheros de COALESCENCIA_DIR; desactivado por defecto); dentro de un worker se coalescen siempre
+COALESCENCIA_ENTRE_WORKERS = os.environ.get("COALESCENCIA_ENTRE_WORKERS", "0") == "1"
+COALESCENCIA_DIR = os.environ.get("COALESCENCIA_DIR", os.path.join(SNAPSHOT_DIR, 'coalescencia'))
+
+
+class CacheLRU:
+    """
+    Caché LRU acotada y segura entre hilos, con contadores de aciertos y fallos
+    Las claves deben incluir la versión de los datos para no servir resultados antiguos
+    """
+
+    def __init__(self, max_entradas):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave):
+        """Devuelve el valor cacheado o None si no existe"""
+        with self._lock:
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return self._entradas[clave]
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave, valor):
+        """Guarda un valor, expulsando el menos usado si se supera el límite"""
+        with self._lock:
+            self._entradas[clave] = valor
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self):
+        """Vacía la caché (por ejemplo, tras recargar los datos)"""
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        """Resumen de uso de la caché"""
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': self.aciertos / total if total else 0.0,
+            }
+
+
+def serializar_componente(componente):
+    """
+    Convierte un árbol de componentes Dash en dicts/listas planas (formato JSON de Dash)
+    Dash puede devolver este formato directamente, sin recorrer de nuevo los componentes
+    """
+    if isinstance(componente, (list, tuple)):
+        return [serializar_componente(c) for c in componente]
+    if hasattr(componente, 'to_plotly_json'):
+        datos = componente.to_plotly_json()
+        props = dict(datos['props'])
+        if props.get('children') is None:
+            props.pop('children', None)
+        else:
+            props['children'] = serializar_componente(props['children'])
+        return {'props': props, 'type': datos['type'], 'namespace': datos['namespace']}
+    return componente
+
+
+class VuelosEnCurso:
+    """
+    Coalescencia de cálculos idénticos (single-flight): mientras se calcula una clave, las demás
+    peticiones con la misma clave esperan ese cálculo y comparten su resultado en lugar de repetirlo
+    - En el worker: la primera petición calcula y el resto espera a su Future
+    - Entre workers (con `directorio`): la que calcula tiene el lock (fcntl) de la clave y anota en él
+      el id de su vuelo; las de otros workers que lo encuentran ocupado esperan a que lo suelte y leen
+      el resultado de ese vuelo. Un resultado solo lo leen las peticiones que esperaron a su cálculo;
+      las que llegan después calculan de nuevo (los ficheros terminados se borran al limpiar)
+    La clave debe incluir la versión de los datos (y solo usarse entre workers si esa versión es común)
+    """
+
+    def __init__(self, directorio=None, limpieza_segundos=60):
+        self.directorio = directorio if fcntl is not None else None
+        self.limpieza_segundos = limpieza_segundos
+        self._vuelos = {}
+        self._lock = threading.Lock()
+        self._ultima_limpieza = 0.0
+        self.calculados = 0
+        self.coalescidos = 0
+        self.leidos_de_otro_worker = 0
+
+    def _contar(self, campo):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def ejecutar(self, clave, funcion, entre_workers=True):
+        """Devuelve funcion() calculada una sola vez para todas las peticiones concurrentes con `clave`"""
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = concurrent.futures.Future()
+            else:
+                self.coalescidos += 1
+        if not lider:
+            return vuelo.result()
+        
+        try:
+            if self.directorio and entre_workers:
+                resultado = self._ejecutar_entre_workers(clave, funcion)
+            else:
+                resultado = funcion()
+                self._contar('calculados')
+        except BaseException as e:
+            vuelo.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._vuelos.pop(clave, None)
+        vuelo.set_result(resultado)
+        return resultado
+
+    def _bloquear(self, ruta_lock):
+        """
+        Abre y bloquea el fichero de lock de una clave. Devuelve (fd, id del vuelo de otro worker al que
+        se ha esperado o None). Si el fichero se borró mientras se esperaba, se vuelve a abrir
+        """
+        vuelo_ajeno = None
+        while True:
+            fd = os.open(ruta_lock, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Otro worker está calculando la clave: se espera a que termine ese vuelo
+                    vuelo_ajeno = os.pread(fd, 64, 0).decode('ascii', 'ignore') or vuelo_ajeno
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                if os.fstat(fd).st_ino == os.stat(ruta_lock).st_ino:
+                    return fd, vuelo_ajeno
+            except FileNotFoundError:
+                pass
+            except BaseException:
+                os.close(fd)
+                raise
+            os.close(fd)
+
+    def _ejecutar_entre_workers(self, clave, funcion):
+        huella = hashlib.sha1(repr(clave).encode('utf-8')).hexdigest()
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            fd, vuelo_ajeno = self._bloquear(os.path.join(self.directorio, f"{huella}.lock"))
+        except OSError as e:
+            print(f"Coalescencia entre workers desactivada para esta petición: {e}")
+            self._contar('calculados')
+            return funcion()
+        
+        try:
+            if vuelo_ajeno:
+                resultado = self._leer_resultado(os.path.join(self.directorio, f"{huella}-{vuelo_ajeno}.json"))
+                if resultado is not None:
+                    self._contar('leidos_de_otro_worker')
+                    return resultado
+            # Sin vuelo de otro worker (o falló): este worker calcula y anota su vuelo en el lock
+            vuelo = f"{os.getpid()}-{time.time_ns()}"
+            os.pwrite(fd, vuelo.encode('ascii'), 0)
+            try:
+                resultado = funcion()
+                self._contar('calculados')
+                try:
+                    ruta_resultado = os.path.join(self.directorio, f"{huella}-{vuelo}.json")
+                    _escribir_atomico(ruta_resultado, lambda temporal: self._escribir_resultado(temporal, resultado))
+                except (OSError, TypeError, ValueError) as e:
+                    print(f"No se pudo compartir el resultado con otros workers: {e}")
+                return resultado
+            finally:
+                os.ftruncate(fd, 0)  # Las peticiones que lleguen después no esperan a este vuelo
+        finally:
+            os.close(fd)  # Libera el lock
+            self._limpiar()
+
+    @staticmethod
+    def _leer_resultado(ruta):
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _escribir_resultado(ruta, resultado):
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, cls=plotly.utils.PlotlyJSONEncoder)
+
+    def _limpiar(self):
+        """
+        Borra (como mucho una vez por `limpieza_segundos`) los resultados de vuelos ya terminados
+        y los locks de claves que nadie está calculando
+        """
+        ahora = time.time()
+        with self._lock:
+            if ahora - self._ultima_limpieza < self.limpieza_segundos:
+                return
+            self._ultima_limpieza = ahora
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return
+        for nombre in nombres:
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if ahora - os.path.getmtime(ruta) <= self.limpieza_segundos:
+                    continue
+                if nombre.endswith('.json'):
+                    os.remove(ruta)
+                elif nombre.endswith('.lock'):
+                    fd = os.open(ruta, os.O_RDWR)
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        os.remove(ruta)  # Quien lo tenga abierto lo detecta (otro inodo) y lo vuelve a crear
+                    except BlockingIOError:
+                        pass
+                    finally:
+                        os.close(fd)
+            except OSError:
+                pass
+
+    def estadisticas(self):
+        """Cálculos hechos, peticiones que esperaron a otra del worker y resultados leídos de otro worker"""
+        with self._lock:
+            return {
+                'en_curso': len(self._vuelos),
+                'calculados': self.calculados,
+                'coalescidos': self.coalescidos,
+                'leidos_de_otro_worker': self.leidos_de_otro_worker,
+                'entre_workers': self.directorio is not None,
+            }
+
+
+cache_diagramas = CacheLRU(CACHE_DIAGRAMAS_MAX)
+cache_matrices = CacheLRU(4)
+cache_evolucion = CacheLRU(CACHE_DIAGRAMAS_MAX)
+cache_graficos = CacheLRU(CACHE_GRAFICOS_MAX)
+cache_plantillas_grafico = CacheLRU(1)
+cache_partidos_equipo = CacheLRU(CACHE_PARTIDOS_EQUIPO_MAX)
+cache_columnas = CacheLRU(8)
+
+vuelos_callbacks = VuelosEnCurso(COALESCENCIA_DIR if COALESCENCIA_ENTRE_WORKERS else None)
+
+
+def estadisticas_caches():
+    """Estadísticas de todas las cachés de resultados"""
+    return {
+        'diagramas': cache_diagramas.estadisticas(),
+        'matrices': cache_matrices.estadisticas(),
+        'evolucion': cache_evolucion.estadisticas(),
+        'graficos': cache_graficos.estadisticas(),
+        'plantillas_grafico': cache_plantillas_grafico.estadisticas(),
+        'partidos_equipo': cache_partidos_equipo.estadisticas(),
+        'particiones': cache_particiones.estadisticas(),
+    }
+
+
+# ============================================================================
+# FUNCIONES DE VISUALIZACIÓN
+# ============================================================================
+
+def bandas_ranking(num_posiciones=NUM_POSICIONES_POR_DEFECTO):
+    """
+    Última posición de la banda verde y de la amarilla para una liga de `num_posiciones` equipos
+    Las bandas verde y roja ocupan 6/22 de la tabla cada una (1-6, 7-16, 17-22 con 22 equipos)
+    """
+    extremo = round(num_posiciones * 6 / 22)
+    return extremo, num_posiciones - extremo
+
+
+def get_color_by_ranking(ranking, num_posiciones=NUM_POSICIONES_POR_DEFECTO):
+    """Retorna el color según la posición en el ranking"""
+    limite_verde, limite_amarillo = bandas_ranking(num_posiciones)
+    if ranking <= limite_verde:
+        return '#00B050'  # Verde
+    elif ranking <= limite_amarillo:
+        return '#FFD700'  # Amarillo
+    else:
+        return '#FF0000'  # Rojo
+
+
+def clase_por_ranking(ranking, num_posiciones=NUM_POSICIONES_POR_DEFECTO):
+    """Clase CSS de la banda de ranking (misma escala que get_color_by_ranking, ver assets/diagrama.css)"""
+    limite_verde, limite_amarillo = bandas_ranking(num_posiciones)
+    if ranking <= limite_verde:
+        return 'v'  # Verde
+    elif ranking <= limite_amarillo:
+        return 'a'  # Amarillo
+    else:
+        return 'r'  # Rojo
+
+
+def numero_posiciones(indice):
+    """Número de posiciones del diagrama: equipos de la tabla de rankings cargada"""
+    for datos in indice.values():
+        return datos['equipos']
+    return NUM_POSICIONES_POR_DEFECTO
+
+
+def crear_columna_no_disponible(num_posiciones=NUM_POSICIONES_POR_DEFECTO):
+    """
+    Crea una columna gris oscuro para métricas no disponibles
+    """
+    slots = [html.Div(title="Datos no disponibles", className='slot nd') for pos in range(1, num_posiciones + 1)]
+    return html.Div(slots, className='col-ranking')
+
+
+def calcular_rankings(df, configs=None, metodo=None):
+    """
+    Rankings (1 = mejor) de todas las métricas configuradas a partir de sus valores
+    Se calculan en una sola pasada: las métricas en las que es mejor un valor alto se cambian
+    de signo y se ordena toda la matriz equipos x métricas a la vez (ascendente, empates según
+    `metodo`). Los equipos sin valor quedan sin ranking. Devuelve las columnas *_ranking.
+    """
+    if configs is None:
+        configs = [ESTILO_CONFIG, RENDIMIENTO_CONFIG]
+    
+    columnas = []
+    signos = []
+    for config in configs:
+        for metrica in config['metricas']:
+            metrica_col = metrica['columna']
+            if metrica.get('vacia', False) or metrica_col in columnas or metrica_col not in df.columns:
+                continue
+            columnas.append(metrica_col)
+            signos.append(1.0 if metrica.get('menor_es_mejor', False) else -1.0)
+    
+    valores = df[columnas].to_numpy(dtype=float) * np.array(signos)
+    rankings = pd.DataFrame(valores, index=df.index, columns=columnas).rank(
+        method=metodo or METODO_RANKING, na_option='keep')
+    return rankings.add_suffix('_ranking')
+
+
+def completar_rankings(df, configs=None):
+    """
+    Tabla de rankings con las columnas *_ranking calculadas en la app (ver calcular_rankings):
+    todas con RANKINGS_EN_APP o solo las que no vengan en la tabla
+    """
+    if df.empty or 'fullName' not in df.columns:
+        return df
+    if configs is None:
+        configs = [ESTILO_CONFIG, RENDIMIENTO_CONFIG]
+    
+    faltan = any(
+        f"{m['columna']}_ranking" not in df.columns
+        for config in configs for m in config['metricas']
+        if not m.get('vacia', False) and m['columna'] in df.columns
+    )
+    if not RANKINGS_EN_APP and not faltan:
+        return df
+    
+    calculados = calcular_rankings(df, configs)
+    if not RANKINGS_EN_APP:
+        calculados = calculados[[c for c in calculados.columns if c not in df.columns]]
+    return df.drop(columns=[c for c in calculados.columns if c in df.columns]).join(calculados)
+
+
+def construir_indice_rankings(df, configs=None):
+    """
+    Construye el índice de rankings a partir de df_rankings (una vez por carga)
+    Para cada métrica: posición -> (posición de origen, equipos, valor), equipo -> ranking
+    y número de equipos de la tabla (posiciones del diagrama)
+    Las posiciones vacías por empate apuntan al grupo empatado que las cubre
+    """
+    if configs is None:
+        configs = [ESTILO_CONFIG, RENDIMIENTO_CONFIG]
+    
+    indice = {}
+    if df.empty or 'fullName' not in df.columns:
+        return indice
+    
+    df = completar_rankings(df, configs)
+    num_posiciones = int(df['fullName'].nunique())
+    
+    for config in configs:
+        for metrica in config['metricas']:
+            metrica_col = metrica['columna']
+            ranking_col = f"{metrica_col}_ranking"
+            if metrica_col in indice or metrica.get('vacia', False):
+                continue
+            if ranking_col not in df.columns or metrica_col not in df.columns:
+                continue
+            
+            datos = df[['fullName', metrica_col, ranking_col]].dropna(subset=[ranking_col])
+            rankings = datos[ranking_col].astype(int)
+            
+            # Agrupar los equipos por posición (mismo orden que en la tabla original)
+            grupos = {}
+            for pos, grupo in datos.groupby(rankings, sort=True):
+                grupos[int(pos)] = (tuple(grupo['fullName']), float(grupo[metrica_col].iloc[0]))
+            
+            # Tabla de posiciones: las vacías quedan cubiertas por el empate superior más cercano
+            posiciones = {}
+            ultimo_grupo = None
+            for pos in range(1, num_posiciones + 1):
+                if pos in grupos:
+                    nombres, valor = grupos[pos]
+                    ultimo_grupo = (pos, nombres, valor)
+                    posiciones[pos] = ultimo_grupo
+                elif ultimo_grupo is not None and ultimo_grupo[0] + len(ultimo_grupo[1]) - 1 >= pos:
+                    posiciones[pos] = ultimo_grupo
+            
+            # Ranking de cada equipo (primera aparición, como en el filtrado original)
+            rangos = {}
+            for nombre, ranking in zip(datos['fullName'], rankings):
+                rangos.setdefault(nombre, int(ranking))
+            
+            indice[metrica_col] = {'posiciones': posiciones, 'rangos': rangos, 'equipos': num_posiciones}
+    
+    return indice
+
+
+def ids_equipos(df_rankings):
+    """fullName -> teamId según la tabla de rankings (primera aparición)"""
+    ids = {}
+    if not df_rankings.empty and {'fullName', 'teamId'} <= set(df_rankings.columns):
+        for nombre, team_id in zip(df_rankings['fullName'], df_rankings['teamId']):
+            ids.setdefault(nombre, team_id)
+    return ids
+
+
+def ordenar_tablas_por_equipo(df_rankings, df_partidos, df_fisicas):
+    """
+    Tablas derivadas ordenadas por equipo y fecha, con la etiqueta del eje X ya calculada
+    En las físicas el rival se une desde la tabla de partidos (si no hay, se usa la fecha)
+    Cada equipo ocupa un bloque contiguo de filas
+    """
+    partidos = pd.DataFrame()
+    if not df_partidos.empty and {'fullName', 'gameDate', 'oppFullName'} <= set(df_partidos.columns):
+        partidos = df_partidos.sort_values(['fullName', 'gameDate'], kind='stable').reset_index(drop=True)
+        partidos['etiqueta'] = partidos['oppFullName'].astype(str).astype('category')
+    
+    fisicas = pd.DataFrame()
+    nombres_por_id = {}
+    for nombre, team_id in ids_equipos(df_rankings).items():
+        nombres_por_id.setdefault(team_id, nombre)
+    if not df_fisicas.empty and {'teamId', 'gameDate'} <= set(df_fisicas.columns) and nombres_por_id:
+        fisicas = df_fisicas[df_fisicas['teamId'].isin(list(nombres_por_id))]
+        fisicas = fisicas.assign(fullName=fisicas['teamId'].map(nombres_por_id).astype(str))
+        fisicas = fisicas.sort_values(['fullName', 'gameDate'], kind='stable')
+        
+        if not partidos.empty and 'gameId' in partidos.columns and 'gameId' in fisicas.columns:
+            rivales = partidos[['fullName', 'gameId', 'oppFullName']].drop_duplicates()
+            rivales['fullName'] = rivales['fullName'].astype(str)
+            fisicas = fisicas.merge(rivales, on=['fullName', 'gameId'], how='left')
+            etiqueta = fisicas['oppFullName'].astype(object).fillna(fisicas['gameDate'].astype(str))
+        else:
+            etiqueta = fisicas['gameDate'].astype(str)
+        
+        fisicas = fisicas.reset_index(drop=True)
+        fisicas['etiqueta'] = etiqueta.astype(str).astype('category').values
+        fisicas['fullName'] = fisicas['fullName'].astype('category')
+    
+    return {'partidos': partidos, 'fisicas': fisicas}
+
+
+def _bloques_por_equipo(tabla):
+    """fullName -> filas del equipo en una tabla ordenada por equipo (cortes sin copia)"""
+    if tabla.empty:
+        return {}
+    codigos, nombres = pd.factorize(tabla['fullName'])
+    cambios = np.flatnonzero(np.diff(codigos)) + 1
+    inicios = np.concatenate(([0], cambios))
+    fines = np.concatenate((cambios, [len(tabla)]))
+    return {nombres[codigos[inicio]]: tabla.iloc[inicio:fin] for inicio, fin in zip(inicios, fines)}
+
+
+def construir_indice_partidos(df_rankings, df_partidos, df_fisicas, tablas_ordenadas=None):
+    """
+    Construye (una vez por carga) los partidos de cada equipo ordenados por fecha
+    - partidos: fullName -> partidos del equipo con la columna 'etiqueta' (rival)
+    - fisicas: fullName -> métricas físicas del equipo con el rival ya unido desde partidos
+    - ids: fullName -> teamId (según la tabla de rankings)
+    - tablas: tablas ordenadas de las que salen los cortes (se guardan en el snapshot compartido)
+    """
+    if tablas_ordenadas is None:
+        tablas_ordenadas = ordenar_tablas_por_equipo(df_rankings, df_partidos, df_fisicas)
+    
+    return {
+        'partidos': _bloques_por_equipo(tablas_ordenadas['partidos']),
+        'fisicas': _bloques_por_equipo(tablas_ordenadas['fisicas']),
+        'ids': ids_equipos(df_rankings),
+        'tablas': tablas_ordenadas,
+    }
+
+
+def construir_matriz_rankings(indice, version):
+    """
+    Matriz compacta de rankings (métrica x posición) para renderizar el diagrama en el navegador
+    Se envía una vez por versión de datos; cambiar de equipo no necesita volver al servidor.
+    Por métrica: 'n' nombre, 'e' estado ('ok', 'vacia', 'nd'),
+    'p' por posición [posición de origen, índices de equipos, valor] y 'r' ranking de cada equipo.
+    'bandas' son las últimas posiciones verde y amarilla (ver bandas_ranking)
+    """
+    equipos = sorted({nombre for datos in indice.values() for nombre in datos['rangos']})
+    num_posiciones = numero_posiciones(indice)
+    indice_equipo = {nombre: i for i, nombre in enumerate(equipos)}
+    
+    diagramas = {}
+    for clave, config in (('estilo', ESTILO_CONFIG), ('rendimiento', RENDIMIENTO_CONFIG)):
+        metricas = []
+        for metrica in config['metricas']:
+            datos_metrica = indice.get(metrica['columna'])
+            if metrica.get('vacia', False):
+                metricas.append({'n': metrica['nombre'], 'e': 'vacia'})
+            elif not metrica.get('disponible', True) or datos_metrica is None:
+                metricas.append({'n': metrica['nombre'], 'e': 'nd'})
+            else:
+                posiciones = []
+                for pos in range(1, num_posiciones + 1):
+                    entrada = datos_metrica['posiciones'].get(pos)
+                    if entrada is None:
+                        posiciones.append(None)
+                    else:
+                        # El valor va ya formateado para que el tooltip coincida con el del servidor
+                        posiciones.append([entrada[0], [indice_equipo[n] for n in entrada[1]], f"{entrada[2]:.2f}"])
+                metricas.append({
+                    'n': metrica['nombre'],
+                    'e': 'ok',
+                    'p': posiciones,
+                    'r': [datos_metrica['rangos'].get(nombre) for nombre in equipos],
+                })
+        diagramas[clave] = {'metricas': metricas}
+    
+    return {
+        'version': version,
+        'posiciones': num_posiciones,
+        'bandas': list(bandas_ranking(num_posiciones)),
+        'equipos': equipos,
+        'diagramas': diagramas,
+    }
+
+
+def valores_json(serie):
+    """
+    Valores de una columna como lista de float para JSON. Los float32 se pasan por su
+    representación decimal más corta (0.85 y no 0.8500000238418579); NaN queda como NaN
+    """
+    valores = serie.to_numpy()
+    if valores.dtype == np.float32:
+        valores = valores.astype(str).astype(float)
+    return np.asarray(valores, dtype=float).tolist()
+
+
+def bloque_evolucion(df_equipo, columnas):
+    """Etiquetas de rival y valores por partido de las columnas disponibles de un equipo"""
+    if df_equipo is None:
+        return None
+    return {
+        'x': df_equipo['etiqueta'].astype(str).tolist(),
+        'y': {col: valores_json(df_equipo[col]) for col in columnas if col in df_equipo.columns},
+    }
+
+
+class ConsultaPartidosFallida(Exception):
+    """La consulta bajo demanda de los partidos de un equipo falló o no respondió a tiempo"""
+
+
+AVISO_CONSULTA_FALLIDA = "No se pudieron consultar los partidos del equipo; inténtelo de nuevo en unos segundos"
+
+
+def partidos_bajo_demanda(snapshot, equipo):
+    """
+    Partidos y físicas de un equipo consultados a la BD (PARTIDOS_BAJO_DEMANDA), con la misma forma
+    que los bloques de construir_indice_partidos. Se cachean por (equipo, versión de datos);
+    si la consulta falla, tarda más de CONSULTA_TIMEOUT_SEGUNDOS o el circuito está abierto
+    se devuelve None sin cachear.
+    """
+    clave = (equipo, snapshot.version_partidos)
+    tablas = cache_partidos_equipo.obtener(clave)
+    if tablas is not None:
+        return tablas
+    
+    team_id = snapshot.indice_partidos['ids'].get(equipo)
+    filtros = filtros_particion(snapshot.particion)
+
+    def consultar():
+        columnas = cache_columnas.obtener(snapshot.version_partidos)
+        if columnas is None:
+            columnas = {
+                tabla: columnas_disponibles(tabla, PLAN_COLUMNAS[tabla])
+                for tabla in (TABLA_PARTIDOS, TABLA_FISICAS)
+            }
+            cache_columnas.guardar(snapshot.version_partidos, columnas)
+        
+        inicio = time.perf_counter()
+        partidos, fisicas = leer_partidos_equipo(
+            equipo,
+            _valor_parametro(team_id) if team_id is not None else None,
+            columnas[TABLA_PARTIDOS],
+            [c for c in columnas[TABLA_FISICAS] if c != 'oppFullName'],
+            filtros,
+        )
+        if METRICAS_ACTIVAS:
+            metrica_consulta_segundos.observar(time.perf_counter() - inicio, 'partidos_equipo')
+            metrica_consulta_filas.incrementar(len(partidos) + len(fisicas), 'partidos_equipo')
+        
+        tablas = {'partidos': None, 'fisicas': None}
+        if not partidos.empty:
+            partidos = compactar_tipos(partidos)
+            partidos['etiqueta'] = partidos['oppFullName'].astype(str).astype('category')
+            tablas['partidos'] = partidos
+        if not fisicas.empty:
+            fisicas = compactar_tipos(fisicas)
+            etiqueta = fisicas['oppFullName'].astype(object).fillna(fisicas['gameDate'].astype(str))
+            fisicas['etiqueta'] = etiqueta.astype(str).astype('category')
+            tablas['fisicas'] = fisicas
+        return tablas
+    
+    # Con la BD lenta la respuesta tardía se cachea para la siguiente petición
+    tablas = consultar_bd(
+        consultar,
+        al_terminar_tarde=lambda tablas: cache_partidos_equipo.guardar(clave, tablas),
+        descripcion=f"Partidos de {equipo}",
+    )
+    if tablas is not None:
+        cache_partidos_equipo.guardar(clave, tablas)
+    return tablas
+
+
+def tablas_equipo(snapshot, equipo):
+    """
+    Partidos y métricas físicas de un equipo para el gráfico de evolución ('partidos' y 'fisicas',
+    ordenados por fecha y con la columna 'etiqueta', o None), y si hay datos de cada tabla
+    Salen del índice del snapshot o, con PARTIDOS_BAJO_DEMANDA, de una consulta por equipo; si esa
+    consulta falla lanza ConsultaPartidosFallida, para que el resultado no se cachee ni se comparta
+    """
+    if PARTIDOS_BAJO_DEMANDA:
+        tablas = partidos_bajo_demanda(snapshot, equipo)
+        if tablas is None:
+            raise ConsultaPartidosFallida(equipo)
+        return dict(tablas, hay_partidos=True, hay_fisicas=True)
+    
+    indice_partidos = snapshot.indice_partidos
+    return {
+        'partidos': indice_partidos['partidos'].get(equipo),
+        'fisicas': indice_partidos['fisicas'].get(equipo),
+        'hay_partidos': not snapshot.df_partidos.empty,
+        'hay_fisicas': not snapshot.df_fisicas.empty,
+    }
+
+
+def construir_datos_evolucion(snapshot, equipo):
+    """
+    Matriz por partido de un equipo para el gráfico de evolución en el navegador
+    (assets/grafico_cliente.js): todas las métricas de ESTILO y RENDIMIENTO con las
+    etiquetas de rival, en un bloque para partidos y otro para métricas físicas.
+    Si no hay datos, el bloque lleva el aviso que mostraría el servidor.
+    """
+    indice_partidos = snapshot.indice_partidos
+    columnas = list(dict.fromkeys(
+        m['columna']
+        for config in (ESTILO_CONFIG, RENDIMIENTO_CONFIG)
+        for m in config['metricas']
+        if m.get('disponible', True)
+    ))
+    
+    tablas = tablas_equipo(snapshot, equipo)
+    
+    if not tablas['hay_partidos']:
+        partidos = {'aviso': None}
+    else:
+        partidos = bloque_evolucion(tablas['partidos'], columnas) or {'x': [], 'y': {}}
+    
+    if not tablas['hay_fisicas']:
+        fisicas = {'aviso': "No hay datos físicos disponibles"}
+    elif equipo not in indice_partidos['ids']:
+        fisicas = {'aviso': "Equipo no encontrado"}
+    else:
+        fisicas = bloque_evolucion(tablas['fisicas'], METRICAS_FISICAS) or {'x': [], 'y': {}}
+    
+    return {
+        'equipo': equipo,
+        'datos': snapshot.version_partidos,
+        'metricas_fisicas': METRICAS_FISICAS,
+        'partidos': partidos,
+        'fisicas': fisicas,
+    }
+
+
+def crear_columna_ranking(indice, metrica_col, equipo_seleccionado, disponible=True):
+    """
+    Crea una columna visual con un slot por equipo de la liga para representar el ranking
+    Los slots se colorean desde abajo (última posición) hasta la posición del equipo
+    """
+    num_posiciones = numero_posiciones(indice)
+    
+    # Si la métrica no está disponible, mostrar columna gris oscuro
+    if not disponible:
+        return crear_columna_no_disponible(num_posiciones)
+    
+    datos_metrica = indice.get(metrica_col)
+    if datos_metrica is None:
+        return crear_columna_no_disponible(num_posiciones)
+    
+    # Obtener el ranking del equipo seleccionado
+    ranking_equipo = datos_metrica['rangos'].get(equipo_seleccionado)
+    if ranking_equipo is None:
+        return crear_columna_no_disponible(num_posiciones)
+    
+    clase_equipo = clase_por_ranking(ranking_equipo, num_posiciones)
+    posiciones = datos_metrica['posiciones']
+    
+    # Crear los slots (de posición 1 arriba a la última abajo)
+    slots = []
+    for pos in range(1, num_posiciones + 1):
+        # Encontrar qué equipo está en esta posición
+        entrada = posiciones.get(pos)
+        
+        if entrada is not None and entrada[0] == pos:
+            nombre_equipo_pos = entrada[1][0]
+            valor_metrica = entrada[2]
+            tooltip_text = f"#{pos} {nombre_equipo_pos}: {valor_metrica:.2f}"
+        else:
+            tooltip_text = f"Posición {pos}"
+        
+        # Colorear desde la posición del equipo hacia abajo (hasta la última)
+        # Es decir, si el equipo está en posición 5, se colorean del 5 al final;
+        # la posición exacta del equipo seleccionado lleva además la marca
+        clase = 'slot'
+        if pos >= ranking_equipo:
+            clase += f" {clase_equipo}"
+        if pos == ranking_equipo:
+            clase += ' sel'
+        
+        slots.append(html.Div(title=tooltip_text, className=clase))
+    
+    return html.Div(slots, className='col-ranking')
+
+
+def tooltip_posicion(pos, entrada):
+    """Texto del tooltip de una celda a partir de la entrada del índice de rankings"""
+    if entrada is None:
+        return f"Posición {pos}"
+    
+    pos_origen, nombres_equipos, valor_metrica = entrada
+    if len(nombres_equipos) > 1:
+        # Múltiples equipos comparten esta posición (o la cubren por empate)
+        nombres_str = ', '.join(nombres_equipos)
+        return f"#{pos_origen} ({len(nombres_equipos)} equipos): {nombres_str} - Valor: {valor_metrica:.2f}"
+    
+    # Solo un equipo en esta posición
+    return f"#{pos_origen} {nombres_equipos[0]}: {valor_metrica:.2f}"
+
+
+def estado_celda(datos_metrica, pos, equipo_seleccionado):
+    """
+    Clase CSS y tooltip de una celda de métrica del diagrama para el equipo seleccionado
+    Es lo único que cambia entre equipos (ver diferencias_diagrama)
+    """
+    ranking_equipo = datos_metrica['rangos'].get(equipo_seleccionado)
+    if ranking_equipo is None:
+        return '', f"Posición {pos}"
+    
+    # Equipos en esta posición (o grupo empatado que la cubre)
+    tooltip = tooltip_posicion(pos, datos_metrica['posiciones'].get(pos))
+    
+    # Colorear desde la posición del equipo hacia abajo y marcar su posición exacta
+    clase = clase_por_ranking(ranking_equipo, datos_metrica['equipos']) if pos >= ranking_equipo else ''
+    if pos == ranking_equipo:
+        clase += ' sel'
+    
+    return clase.strip(), tooltip
+
+
+def crear_celda_metrica(clase, tooltip):
+    """Celda de métrica: sin clase se queda en gris claro (estilo por defecto de la celda)"""
+    if clase:
+        return html.Td(title=tooltip, className=clase)
+    return html.Td(title=tooltip)
+
+
+def crear_tabla_diagrama(indice, config, equipo_seleccionado):
+    """
+    Crea la tabla visual del diagrama con métricas (sin jerarquía de bloques)
+    Solo lee del índice de rankings (ver construir_indice_rankings); los estilos
+    van en assets/diagrama.css y cada celda solo lleva su clase
+    """
+    # Cabecera de métricas
+    header_cells = [html.Th('Pos', className='pos')]
+    for metrica in config['metricas']:
+        # Columnas vacías en gris claro, no disponibles en gris oscuro
+        if metrica.get('vacia', False):
+            header_cells.append(html.Th(metrica['nombre'], className='vac'))
+        elif not metrica.get('disponible', True):
+            header_cells.append(html.Th(metrica['nombre'], className='nd'))
+        else:
+            header_cells.append(html.Th(metrica['nombre']))
+    
+    # Crear filas del body (una posición por equipo de la liga)
+    num_posiciones = numero_posiciones(indice)
+    body_rows = []
+    for pos in range(1, num_posiciones + 1):
+        row_cells = [html.Td(str(pos), className='pos')]
+        
+        # Añadir celdas de cada métrica para esta posición
+        for metrica in config['metricas']:
+            datos_metrica = indice.get(metrica['columna'])
+            
+            if metrica.get('vacia', False):
+                # Columna vacía: sin relleno, sin tooltip, sin interacción
+                row_cells.append(html.Td(className='vac'))
+            elif not metrica.get('disponible', True) or datos_metrica is None:
+                # Métrica no disponible
+                row_cells.append(html.Td(title="Datos no disponibles", className='nd'))
+            else:
+                row_cells.append(crear_celda_metrica(*estado_celda(datos_metrica, pos, equipo_seleccionado)))
+        
+        body_rows.append(html.Tr(row_cells))
+    
+    # Crear tabla
+    tabla = html.Table([
+        html.Thead(html.Tr(header_cells)),
+        html.Tbody(body_rows)
+    ])
+    
+    # Leyenda
+    limite_verde, limite_amarillo = bandas_ranking(num_posiciones)
+    leyenda = html.Div([
+        html.Span(f'■ 1-{limite_verde}', className='ley-v'),
+        html.Span(f'■ {limite_verde + 1}-{limite_amarillo}', className='ley-a'),
+        html.Span(f'■ {limite_amarillo + 1}-{num_posiciones}', className='ley-r'),
+    ], className='leyenda')
+    
+    return html.Div([tabla, leyenda], className='diagrama')
+
+
+def diferencias_diagrama(indice, config, equipo_anterior, equipo_nuevo):
+    """
+    Celdas del diagrama que cambian al pasar de un equipo a otro
+    Devuelve (fila, columna, estado anterior, estado nuevo) con el estado de estado_celda
+    """
+    cambios = []
+    for columna, metrica in enumerate(config['metricas'], start=1):  # La columna 0 es 'Pos'
+        datos_metrica = indice.get(metrica['columna'])
+        if metrica.get('vacia', False) or not metrica.get('disponible', True) or datos_metrica is None:
+            continue
+        for pos in range(1, datos_metrica['equipos'] + 1):
+            antes = estado_celda(datos_metrica, pos, equipo_anterior)
+            despues = estado_celda(datos_metrica, pos, equipo_nuevo)
+            if antes != despues:
+                cambios.append((pos - 1, columna, antes, despues))
+    return cambios
+
+
+def parche_diagrama(cambios):
+    """Patch de Dash que aplica los cambios de celdas sobre el diagrama ya renderizado"""
+    parche = Patch()
+    # Div contenedor -> [tabla, leyenda]; tabla -> [Thead, Tbody]; Tbody -> filas; fila -> celdas
+    filas = parche['props']['children'][0]['props']['children'][1]['props']['children']
+    for fila, columna, antes, despues in cambios:
+        celda = filas[fila]['props']['children'][columna]['props']
+        if antes[0] != despues[0]:
+            celda['className'] = despues[0]
+        if antes[1] != despues[1]:
+            celda['title'] = despues[1]
+    return parche
+
+
+# ============================================================================
+# SNAPSHOT DE DATOS Y RECARGA EN SEGUNDO PLANO
+# ============================================================================
+
+@dataclass(frozen=True)
+class SnapshotDatos:
+    """
+    Vista inmutable de los datos cargados y sus índices derivados
+    Los callbacks leen el snapshot una sola vez y trabajan siempre sobre esa vista;
+    una recarga construye un snapshot nuevo y lo sustituye de forma atómica
+    """
+    df_rankings: pd.DataFrame
+    df_partidos: pd.DataFrame
+    df_fisicas: pd.DataFrame
+    indice_rankings: dict
+    indice_partidos: dict
+    version: int
+    cargado_en: float
+    origen: str = 'bd'  # 'bd' o la versión del snapshot compartido de la que se leyó
+    particion: tuple = None  # (competición, temporada) o None si los datos no están particionados
+    leido_en: float = None  # Cuándo se leyeron los datos de la BD (None si no hay datos)
+    tablas_pendientes: tuple = ()  # Tablas que no se pudieron cargar (se conservan las anteriores)
+    versiones_tablas: dict = field(default_factory=dict)  # Huella de cada tabla en la BD (ver sondear_tablas)
+    
+    def version_tabla(self, nombre):
+        """
+        Versión de los datos de una tabla ('rankings', 'partidos' o 'fisicas'): su huella en la BD, igual
+        en todos los workers y entre recargas sin cambios; sin huella, la versión compartida o la local
+        """
+        huella = self.versiones_tablas.get(nombre)
+        if huella:
+            return huella
+        return self.origen if self.origen != 'bd' else f"{os.getpid()}:{self.version}"
+    
+    def version_compartida(self, *nombres):
+        """Si la versión de esas tablas es la misma en todos los workers (huella o snapshot compartido)"""
+        return self.origen != 'bd' or all(self.versiones_tablas.get(n) for n in nombres)
+    
+    @property
+    def version_rankings(self):
+        """Clave de las cachés e índices que solo dependen de los rankings (diagramas y matriz)"""
+        return f"{self.particion}:{self.version_tabla('rankings')}"
+    
+    @property
+    def version_partidos(self):
+        """Clave de las cachés del gráfico de evolución (partidos y físicas, con los ids de los rankings)"""
+        return (f"{self.particion}:{self.version_tabla('rankings')}:"
+                f"{self.version_tabla('partidos')}:{self.version_tabla('fisicas')}")
+    
+    @property
+    def id_datos(self):
+        """Identificador de los datos del diagrama válido entre workers"""
+        return self.version_rankings
+
+
+_contador_versiones = itertools.count(1)
+_snapshot_lock = threading.Lock()
+
+
+def construir_snapshot(df_rankings, df_partidos, df_fisicas, tablas_ordenadas=None, origen='bd', particion=None,
+                       leido_en=None, tablas_pendientes=(), versiones_tablas=None, indice_rankings=None):
+    """
+    Construye un snapshot completo (con índices) a partir de las tablas cargadas
+    Con `indice_rankings` (de un snapshot con la misma versión de rankings) no se vuelve a construir
+    """
+    return SnapshotDatos(
+        df_rankings=df_rankings,
+        df_partidos=df_partidos,
+        df_fisicas=df_fisicas,
+        indice_rankings=indice_rankings if indice_rankings is not None else construir_indice_rankings(df_rankings),
+        indice_partidos=construir_indice_partidos(df_rankings, df_partidos, df_fisicas, tablas_ordenadas),
+        version=next(_contador_versiones),
+        cargado_en=time.time(),
+        origen=origen,
+        particion=particion,
+        leido_en=leido_en if not df_rankings.empty else None,
+        tablas_pendientes=tuple(tablas_pendientes),
+        versiones_tablas={nombre: huella for nombre, huella in (versiones_tablas or {}).items() if huella},
+    )
+
+
+def cargar_snapshot(anterior=None, particion=None, al_cargar_rankings=None):
+    """
+    Carga las tres tablas (de una partición, si se indica) desde la base de datos y construye un snapshot
+    Antes se sondea cada tabla (ver sondear_tablas): con un snapshot anterior de la misma partición solo se
+    cargan las tablas cuya huella ha cambiado (las de partidos de forma incremental, comprobando el resultado
+    con los agregados del sondeo) y, si no ha cambiado ninguna, se devuelve el propio snapshot anterior.
+    Las tablas se cargan en paralelo, cada una con CARGA_TABLA_TIMEOUT_SEGUNDOS: si una tabla de partidos
+    falla o no llega a tiempo se conservan sus datos anteriores (o queda vacía) y se anota en
+    `tablas_pendientes`. En cuanto llegan los rankings se entrega a `al_cargar_rankings` un snapshot
+    solo con ellos (sin esperar a las tablas de partidos)
+    """
+    leido_en = time.time()
+    if anterior is not None and (anterior.particion != particion or anterior.df_rankings.empty):
+        anterior = None
+    
+    versiones, agregados = sondear_tablas(particion) if DETECCION_CAMBIOS else ({}, {})
+    versiones = {nombre: huella for nombre, huella in versiones.items() if huella}
+    # Con PARTIDOS_BAJO_DEMANDA los partidos se consultan por equipo al pedir el gráfico (ver tablas_equipo):
+    # solo se carga la tabla de rankings, pero las huellas de partidos sirven de clave a su caché
+    nombres = ('rankings',) if PARTIDOS_BAJO_DEMANDA else ('rankings', 'partidos', 'fisicas')
+    sin_cambios = set()
+    if anterior is not None:
+        sin_cambios = {
+            nombre for nombre in nombres
+            if versiones.get(nombre) is not None
+            and versiones[nombre] == anterior.versiones_tablas.get(nombre)
+            and nombre not in anterior.tablas_pendientes
+        }
+        if sin_cambios == set(nombres) and versiones == anterior.versiones_tablas:
+            print(f"Sin cambios en la base de datos{f' ({particion[0]} {particion[1]})' if particion else ''}: "
+                  f"se mantiene la versión {anterior.version}")
+            return anterior
+    
+    anteriores = {
+        'rankings': anterior.df_rankings if anterior is not None else None,
+        'partidos': anterior.df_partidos if anterior is not None else None,
+        'fisicas': anterior.df_fisicas if anterior is not None else None,
+    }
+    ejecutor = obtener_ejecutor('carga-tablas', 3)
+    inicio = time.perf_counter()
+    duraciones = {}
+    
+    def cargar(nombre, cargador, *args):
+        inicio_tabla = time.perf_counter()
+        try:
+            return cargador(*args)
+        finally:
+            duraciones[nombre] = time.perf_counter() - inicio_tabla
+    
+    # Los rankings primero: son lo único que necesita el diagrama
+    futuros = {}
+    for nombre, cargador, args in (
+        ('rankings', cargar_datos_rankings, (particion,)),
+        ('partidos', cargar_datos_partidos, (anteriores['partidos'], particion, agregados.get('partidos'))),
+        ('fisicas', cargar_datos_fisicas, (anteriores['fisicas'], particion, agregados.get('fisicas'))),
+    ):
+        if nombre in nombres and nombre not in sin_cambios:
+            futuros[nombre] = ejecutor.submit(cargar, nombre, cargador, *args)
+    
+    tablas = {nombre: anteriores[nombre] for nombre in sin_cambios}
+    pendientes = []
+    for nombre, futuro in futuros.items():
+        try:
+            tablas[nombre] = futuro.result(timeout=max(0.0, inicio + CARGA_TABLA_TIMEOUT_SEGUNDOS - time.perf_counter()))
+        except concurrent.futures.TimeoutError:
+            print(f"Carga de {nombre}: sin respuesta en {CARGA_TABLA_TIMEOUT_SEGUNDOS:g}s, se conservan los datos anteriores")
+            tablas[nombre] = None
+        except Exception as e:
+            # Un error se trata igual que un timeout: la tabla queda pendiente de la siguiente recarga
+            print(f"Carga de {nombre}: error ({e}), se conservan los datos anteriores")
+            tablas[nombre] = None
+        if nombre == 'rankings':
+            if tablas['rankings'] is None:
+                # Sin rankings la carga no vale: no se espera a las tablas de partidos
+                return construir_snapshot(pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), particion=particion)
+            if al_cargar_rankings is not None and not tablas['rankings'].empty and len(futuros) > 1:
+                al_cargar_rankings(construir_snapshot(
+                    tablas['rankings'], pd.DataFrame(), pd.DataFrame(), particion=particion,
+                    leido_en=leido_en, tablas_pendientes=('partidos', 'fisicas'),
+                    versiones_tablas={'rankings': versiones.get('rankings')}))
+        elif tablas[nombre] is None:
+            pendientes.append(nombre)
+            tablas[nombre] = anteriores[nombre] if anteriores[nombre] is not None else pd.DataFrame()
+    
+    if pendientes:
+        # La huella nueva no corresponde a los datos conservados
+        versiones = dict(versiones, **{
+            nombre: anterior.versiones_tablas.get(nombre) if anterior is not None else None for nombre in pendientes})
+        print(f"Carga parcial: {', '.join(pendientes)} pendientes de la siguiente recarga")
+    elif len(futuros) > 1:
+        # Mejora frente a la carga en serie (la suma de las cargas)
+        medidas = dict(duraciones)
+        print(f"Tablas cargadas en paralelo en {time.perf_counter() - inicio:.2f}s (en serie: {sum(medidas.values()):.2f}s; "
+              + ', '.join(f"{nombre} {segundos:.2f}s" for nombre, segundos in medidas.items()) + ")")
+    if sin_cambios:
+        print(f"Tablas sin cambios (no se recargan): {', '.join(sorted(sin_cambios))}")
+    
+    return construir_snapshot(
+        tablas['rankings'],
+        tablas.get('partidos', pd.DataFrame()),
+        tablas.get('fisicas', pd.DataFrame()),
+        particion=particion,
+        leido_en=leido_en,
+        tablas_pendientes=pendientes,
+        versiones_tablas=versiones,
+        indice_rankings=anterior.indice_rankings if 'rankings' in sin_cambios else None,
+    )
+
+
+def snapshot_con_datos(snapshot):
+    """Una carga solo es válida si ha traído rankings (los cargadores devuelven tablas vacías al fallar)"""
+    return not snapshot.df_rankings.empty
+
+
+def snapshot_completo(snapshot):
+    """Se han cargado todas las tablas (una carga parcial se publica, pero cuenta como fallo de la BD)"""
+    return not snapshot.tablas_pendientes
+
+
+_snapshot_actual = construir_snapshot(pd.DataFrame(), pd.DataFrame(), pd.DataFrame())
+
+# Particiones distintas de la vigente que se han consultado (se cargan bajo demanda)
+cache_particiones = CacheLRU(PARTICIONES_EN_MEMORIA)
+_carga_particiones_lock = threading.Lock()
+_particiones = {'lista': None, 'consultado_en': 0.0}
+
+
+def actualizar_particiones():
+    """Vuelve a consultar la lista de particiones (ver listar_particiones) y la guarda"""
+    _particiones['lista'] = listar_particiones()
+    _particiones['consultado_en'] = time.monotonic()
+    return _particiones['lista']
+
+
+def obtener_particiones():
+    """
+    Particiones disponibles sin esperar nunca a la BD (se llama en cada carga de página): se sirve la
+    última lista conocida (vacía hasta la primera consulta) y, si no hay lista o tiene más de
+    PARTICIONES_TTL_SEGUNDOS, se vuelve a consultar en segundo plano
+    """
+    if _particiones['lista'] is None or time.monotonic() - _particiones['consultado_en'] > PARTICIONES_TTL_SEGUNDOS:
+        revalidar_en_segundo_plano('particiones', consultar_bd, actualizar_particiones, timeout=None,
+                                   descripcion="Lista de particiones")
+    return _particiones['lista'] or []
+
+
+def particion_por_defecto(anterior=None):
+    """
+    Partición que se carga al arrancar y se mantiene en el snapshot vigente: la temporada más reciente
+    (de COMPETICION_POR_DEFECTO si está definida). Sin particiones, la del snapshot anterior
+    Consulta la lista a la BD: se llama desde las cargas, que ya se ejecutan con timeout
+    """
+    try:
+        particiones = actualizar_particiones()
+    except Exception as e:
+        print(f"Error al consultar las particiones: {e}")
+        particiones = _particiones['lista'] or []
+    if COMPETICION_POR_DEFECTO:
+        particiones = [p for p in particiones if p[0] == COMPETICION_POR_DEFECTO] or particiones
+    if particiones:
+        return particiones[0]
+    return anterior.particion if anterior is not None else None
+
+
+def clave_particion(particion):
+    """Valor del selector de partición (texto JSON, los dropdowns solo admiten texto o números)"""
+    return json.dumps(list(particion), ensure_ascii=False) if particion is not None else None
+
+
+def particion_desde_clave(clave):
+    """Inversa de clave_particion"""
+    return tuple(json.loads(clave)) if clave else None
+
+
+def obtener_snapshot(particion=None):
+    """
+    Devuelve el snapshot vigente (lectura atómica de una referencia)
+    Con otra partición, su snapshot se carga de la BD la primera vez (esperando como mucho
+    CONSULTA_TIMEOUT_SEGUNDOS) y se mantiene en cache_particiones; cuando tiene más de
+    REFRESCO_DATOS_SEGUNDOS se sigue sirviendo y se recarga en segundo plano
+    """
+    vigente = _snapshot_actual
+    if particion is None or particion == vigente.particion:
+        return vigente
+    
+    snapshot = cache_particiones.obtener(particion)
+    if snapshot is not None:
+        if REFRESCO_DATOS_SEGUNDOS > 0 and time.time() - snapshot.cargado_en > REFRESCO_DATOS_SEGUNDOS:
+            revalidar_en_segundo_plano(('particion', particion), recargar_particion, particion, snapshot)
+        return snapshot
+    
+    with _carga_particiones_lock:
+        actual = cache_particiones.obtener(particion)
+        if actual is not None:
+            return actual
+        inicio = time.perf_counter()
+        nuevo = consultar_bd(
+            cargar_snapshot, None, particion,
+            valido=snapshot_con_datos,
+            completo=snapshot_completo,
+            al_terminar_tarde=lambda cargado: cache_particiones.guardar(particion, cargado),
+            descripcion=f"Partición {particion}",
+        )
+        if nuevo is None:
+            # Sin datos de la partición: vista vacía sin cachear (se reintenta en la siguiente petición)
+            return construir_snapshot(pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), particion=particion)
+        cache_particiones.guardar(particion, nuevo)
+        print(f"Partición {particion} cargada en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        return nuevo
+
+
+def recargar_particion(particion, anterior):
+    """Recarga (de forma incremental) una partición en segundo plano; si falla se sigue sirviendo la anterior"""
+    nuevo = consultar_bd(cargar_snapshot, anterior, particion, timeout=None, valido=snapshot_con_datos,
+                         completo=snapshot_completo, descripcion=f"Recarga de la partición {particion}")
+    if nuevo is not None:
+        cache_particiones.guardar(particion, nuevo)
+
+
+def publicar_snapshot(snapshot):
+    """
+    Sustituye el snapshot vigente e invalida las cachés derivadas de las tablas que han cambiado
+    (las cachés usan como clave la versión de sus tablas, así que las demás siguen siendo válidas)
+    """
+    global _snapshot_actual
+    with _snapshot_lock:
+        anterior = _snapshot_actual
+        _snapshot_actual = snapshot
+        if snapshot.version_rankings != anterior.version_rankings:
+            cache_diagramas.invalidar()
+            cache_matrices.invalidar()
+        if snapshot.version_partidos != anterior.version_partidos:
+            cache_evolucion.invalidar()
+            cache_graficos.invalidar()
+            cache_partidos_equipo.invalidar()
+            cache_columnas.invalidar()
+
+
+# Resultado de la última recarga desde la BD (se muestra junto a la edad de los datos)
+# comprobado_en: inicio de la última recarga correcta, aunque la BD no hubiera cambiado
+_ultimo_refresco = {'ok': None, 'intentado_en': None, 'en_curso': 0, 'comprobado_en': None}
+_ultimo_refresco_lock = threading.Lock()
+
+
+def registrar_comprobacion(comprobado_en):
+    """
+    Anota que los datos vigentes se comprobaron con la BD en `comprobado_en`
+    El escritor lo guarda en COMPROBADO.json para que el resto de workers muestre la misma edad
+    """
+    if _ultimo_refresco['comprobado_en'] is not None and comprobado_en <= _ultimo_refresco['comprobado_en']:
+        return
+    _ultimo_refresco['comprobado_en'] = comprobado_en
+    if SNAPSHOT_LOCAL and adquirir_escritura_snapshot():
+        try:
+            _escribir_json(os.path.join(SNAPSHOT_DIR, 'COMPROBADO.json'), {'comprobado_en': comprobado_en})
+        except OSError as e:
+            print(f"Error al guardar la hora de comprobación: {e}")
+
+
+def momento_datos(snapshot):
+    """Última vez que los datos del snapshot se leyeron o comprobaron con la BD (None si no hay datos)"""
+    if snapshot.leido_en is None:
+        return None
+    return max(snapshot.leido_en, _ultimo_refresco['comprobado_en'] or 0)
+
+
+def refrescar_datos(timeout=None, al_cargar_rankings=None):
+    """
+    Recarga los datos desde la base de datos y publica el nuevo snapshot
+    Si la carga falla (rankings vacíos), no termina en `timeout` segundos o el circuito está abierto,
+    se mantiene el snapshot anterior; una carga que termina tarde se publica al terminar.
+    Una carga parcial (ver cargar_snapshot) se publica, pero cuenta como fallida para reintentarla pronto
+    """
+    with _ultimo_refresco_lock:
+        if _ultimo_refresco['en_curso']:
+            # Una carga anterior sigue esperando a la BD: no se lanza otra encima
+            print("Recarga de datos omitida: la anterior sigue en curso")
+            return False
+        _ultimo_refresco['en_curso'] += 1
+    inicio = time.perf_counter()
+    anterior = obtener_snapshot()
+    iniciada = threading.Event()
+    terminada = threading.Event()
+    
+    def terminar():
+        with _ultimo_refresco_lock:
+            if not terminada.is_set():
+                terminada.set()
+                _ultimo_refresco['en_curso'] -= 1
+    
+    def cargar():
+        iniciada.set()
+        try:
+            return cargar_snapshot(anterior, particion_por_defecto(anterior), al_cargar_rankings)
+        finally:
+            terminar()
+    
+    def publicar(snapshot):
+        # Solo si nadie ha publicado datos más recientes mientras tanto
+        vigente = obtener_snapshot()
+        if snapshot is vigente:
+            _ultimo_refresco['ok'] = True  # Sin cambios en la BD
+            registrar_comprobacion(comprobado_en)
+            return
+        if vigente.leido_en is None or snapshot.leido_en >= vigente.leido_en:
+            _ultimo_refresco['ok'] = not snapshot.tablas_pendientes
+            if _ultimo_refresco['ok']:
+                registrar_comprobacion(comprobado_en)
+            snapshot = publicar_y_compartir(snapshot)
+            print(f"Datos recargados (versión {snapshot.version}) en {time.perf_counter() - inicio:.2f}s")
+            if EXPORTACION_DIR and adquirir_escritura_snapshot():
+                exportar_en_segundo_plano()  # Solo el escritor (con o sin snapshot compartido)
+    
+    comprobado_en = _ultimo_refresco['intentado_en'] = time.time()
+    try:
+        snapshot = consultar_bd(cargar, timeout=timeout, valido=snapshot_con_datos, completo=snapshot_completo,
+                                al_terminar_tarde=publicar, descripcion="Recarga de datos")
+    finally:
+        if not iniciada.is_set():
+            terminar()  # El circuito no dejó consultar la BD (o la carga aún no ha empezado)
+    if snapshot is None:
+        _ultimo_refresco['ok'] = False
+        print("Recarga de datos fallida: se mantiene el snapshot anterior")
+        return False
+    publicar(snapshot)
+    return _ultimo_refresco['ok']
+
+
+# ============================================================================
+# SNAPSHOT COMPARTIDO (ARRANQUE EN FRÍO Y MEMORIA ENTRE WORKERS)
+# ============================================================================
+#
+# SNAPSHOT_DIR/
+#   ACTUAL.json          -> versión vigente (se sustituye de forma atómica)
+#   COMPROBADO.json      -> última comprobación correcta con la BD (aunque no haya versión nueva)
+#   v<timestamp>/        -> una carpeta por versión con las tablas en Arrow IPC sin comprimir
+#   .escritor.lock       -> lock del único proceso que consulta la BD y escribe versiones
+#
+# Los ficheros se escriben en un solo bloque y sin compresión para poder mapearlos en memoria:
+# las columnas numéricas y los códigos de las categóricas se usan sin copiar, de modo que todos
+# los workers comparten las mismas páginas y añadir workers apenas añade memoria.
+
+# Cambiar si cambia el formato de los ficheros del snapshot local
+VERSION_FORMATO_SNAPSHOT = 3
+
+FICHEROS_SNAPSHOT = {
+    'rankings': 'rankings.arrow',
+    'partidos': 'partidos.arrow',
+    'fisicas': 'fisicas.arrow',
+    'partidos_por_equipo': 'partidos_por_equipo.arrow',
+    'fisicas_por_equipo': 'fisicas_por_equipo.arrow',
+}
+
+_fd_escritor = None
+
+
+def firma_plan_columnas():
+    """Huella del plan de columnas: si cambia la configuración de métricas, el snapshot local no vale"""
+    return hashlib.md5(json.dumps(PLAN_COLUMNAS, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _escribir_atomico(ruta, escribir):
+    """Escribe un fichero en una ruta temporal y lo renombra (los lectores nunca ven ficheros a medias)"""
+    temporal = f"{ruta}.tmp-{os.getpid()}-{threading.get_ident()}"
+    escribir(temporal)
+    os.replace(temporal, ruta)
+
+
+def _escribir_json(ruta, datos):
+    """Escribe un JSON de forma atómica"""
+    def escribir(temporal):
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(datos, f)
+    _escribir_atomico(ruta, escribir)
+
+
+def adquirir_escritura_snapshot(directorio=SNAPSHOT_DIR):
+    """
+    Intenta convertir este proceso en el escritor del snapshot compartido (lock exclusivo no bloqueante)
+    El lock se mantiene mientras viva el proceso; si muere, otro worker lo adquiere en su siguiente sondeo
+    """
+    global _fd_escritor
+    if _fd_escritor is not None or fcntl is None:
+        return True
+    os.makedirs(directorio, exist_ok=True)
+    fd = os.open(os.path.join(directorio, '.escritor.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _fd_escritor = fd
+    return True
+
+
+def _olvidar_escritura_tras_fork():
+    """Un proceso hijo no hereda el papel de escritor (gunicorn --preload)"""
+    global _fd_escritor
+    _fd_escritor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_olvidar_escritura_tras_fork)
+
+
+def _tablas_snapshot(snapshot):
+    """Tablas del snapshot que se guardan en disco (incluidas las tablas ordenadas por equipo)"""
+    tablas = snapshot.indice_partidos['tablas']
+    return {
+        'rankings': snapshot.df_rankings,
+        'partidos': snapshot.df_partidos,
+        'fisicas': snapshot.df_fisicas,
+        'partidos_por_equipo': tablas['partidos'],
+        'fisicas_por_equipo': tablas['fisicas'],
+    }
+
+
+def leer_version_actual(directorio=SNAPSHOT_DIR):
+    """Versión vigente del snapshot compartido según ACTUAL.json (None si no hay)"""
+    try:
+        with open(os.path.join(directorio, 'ACTUAL.json'), encoding='utf-8') as f:
+            return json.load(f).get('version')
+    except (OSError, ValueError):
+        return None
+
+
+def limpiar_versiones_antiguas(directorio=SNAPSHOT_DIR, conservar=SNAPSHOT_VERSIONES_CONSERVADAS):
+    """
+    Borra las versiones más antiguas del snapshot compartido
+    Los workers que aún tengan mapeada una versión borrada siguen funcionando hasta que la sustituyen
+    """
+    versiones = sorted(d for d in os.listdir(directorio) if d.startswith('v') and os.path.isdir(os.path.join(directorio, d)))
+    actual = leer_version_actual(directorio)
+    for version in versiones[:-conservar]:
+        if version != actual:
+            shutil.rmtree(os.path.join(directorio, version), ignore_errors=True)
+
+
+def guardar_snapshot_local(snapshot, directorio=SNAPSHOT_DIR):
+    """
+    Guarda el snapshot como una versión nueva (Arrow IPC sin comprimir, un bloque por tabla)
+    y la publica en ACTUAL.json. Devuelve el nombre de la versión o None si no se guardó.
+    """
+    if snapshot.df_rankings.empty:
+        return None
+    try:
+        version = f"v{time.time_ns()}"
+        directorio_version = os.path.join(directorio, version)
+        os.makedirs(directorio_version, exist_ok=True)
+        
+        filas = {}
+        for nombre, df in _tablas_snapshot(snapshot).items():
+            df = df.reset_index(drop=True)
+            df.to_feather(
+                os.path.join(directorio_version, FICHEROS_SNAPSHOT[nombre]),
+                compression='uncompressed',
+                chunksize=max(len(df), 1),
+            )
+            filas[nombre] = len(df)
+        
+        _escribir_json(os.path.join(directorio_version, 'version.json'), {
+            'version_formato': VERSION_FORMATO_SNAPSHOT,
+            'plan_columnas': firma_plan_columnas(),
+            'guardado_en': time.time(),
+            'leido_en': snapshot.leido_en,
+            'versiones_tablas': snapshot.versiones_tablas,
+            'filas': filas,
+            'particion': list(snapshot.particion) if snapshot.particion is not None else None,
+        })
+        _escribir_json(os.path.join(directorio, 'ACTUAL.json'), {'version': version})
+        limpiar_versiones_antiguas(directorio)
+        return version
+    except Exception as e:
+        print(f"Error al guardar el snapshot local: {e}")
+        return None
+
+
+def _leer_arrow_mapeado(ruta):
+    """Abre un fichero Arrow IPC mapeado en memoria; columnas numéricas y categóricas sin copia"""
+    tabla = pa.ipc.open_file(pa.memory_map(ruta, 'r')).read_all()
+    return tabla.to_pandas(split_blocks=True)
+
+
+def leer_snapshot_local(directorio=SNAPSHOT_DIR, version=None):
+    """
+    Abre (mapeada en memoria) una versión del snapshot compartido, por defecto la vigente
+    Devuelve None si no hay snapshot, es de otro formato/plan o está incompleto
+    """
+    version = version or leer_version_actual(directorio)
+    if version is None:
+        return None
+    directorio_version = os.path.join(directorio, version)
+    try:
+        with open(os.path.join(directorio_version, 'version.json'), encoding='utf-8') as f:
+            sello = json.load(f)
+        if sello.get('version_formato') != VERSION_FORMATO_SNAPSHOT or sello.get('plan_columnas') != firma_plan_columnas():
+            print("Snapshot local descartado: formato o plan de columnas distinto")
+            return None
+        
+        tablas = {}
+        for nombre, fichero in FICHEROS_SNAPSHOT.items():
+            tablas[nombre] = _leer_arrow_mapeado(os.path.join(directorio_version, fichero))
+            if len(tablas[nombre]) != sello['filas'][nombre]:
+                print("Snapshot local descartado: incompleto")
+                return None
+        
+        return construir_snapshot(
+            tablas['rankings'],
+            tablas['partidos'],
+            tablas['fisicas'],
+            tablas_ordenadas={'partidos': tablas['partidos_por_equipo'], 'fisicas': tablas['fisicas_por_equipo']},
+            origen=version,
+            particion=tuple(sello['particion']) if sello.get('particion') else None,
+            leido_en=sello.get('leido_en') or sello.get('guardado_en'),
+            versiones_tablas=sello.get('versiones_tablas'),
+        )
+    except Exception as e:
+        print(f"Error al leer el snapshot local: {e}")
+        return None
+
+
+def publicar_y_compartir(snapshot):
+    """
+    Publica un snapshot recién cargado de la BD. Si este proceso es el escritor, lo guarda antes
+    como versión compartida y publica la copia mapeada (así también comparte memoria con el resto)
+    """
+    if SNAPSHOT_LOCAL and adquirir_escritura_snapshot():
+        version = guardar_snapshot_local(snapshot)
+        compartido = leer_snapshot_local(version=version) if version else None
+        if compartido is not None:
+            snapshot = compartido
+    publicar_snapshot(snapshot)
+    return snapshot
+
+
+def seguir_snapshot_compartido():
+    """Pasa a la versión vigente del snapshot compartido si el escritor publicó una nueva"""
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, 'COMPROBADO.json'), encoding='utf-8') as f:
+            comprobado_en = json.load(f).get('comprobado_en')
+        if comprobado_en is not None:
+            _ultimo_refresco['comprobado_en'] = max(comprobado_en, _ultimo_refresco['comprobado_en'] or 0)
+    except (OSError, ValueError):
+        pass
+    version = leer_version_actual()
+    if version is None or version == obtener_snapshot().origen:
+        return False
+    snapshot = leer_snapshot_local(version=version)
+    if snapshot is None:
+        return False
+    publicar_snapshot(snapshot)
+    print(f"Snapshot compartido {version} publicado (versión {snapshot.version})")
+    return True
 
 
-def crear_columna_no_disponible():
-    """
-    Crea una columna gris oscuro para métricas no disponibles
-    """
-    slots = []
-    for pos in range(1, 23):
-        slot = html.Div(
-            '',
-            title=f"Datos no disponibles",
-            style={
-                'height': '20px',
-                'backgroundColor': '#4a4a4a',  # Gris oscuro
-                'borderBottom': '1px solid #333',
-                'display': 'flex',
-                'alignItems': 'center',
-                'justifyContent': 'center',
-            }
-        )
-        slots.append(slot)
-    
-    return html.Div(slots, style={'display': 'flex', 'flexDirection': 'column'})
+# Se activa cuando la carga inicial (o la reconciliación del escritor) ha publicado todas las tablas o ha fallado
+carga_inicial_completa = threading.Event()
 
 
-def crear_columna_ranking(df, metrica_col, equipo_seleccionado, disponible=True):
+def cargar_datos_iniciales():
     """
-    Crea una columna visual con 22 slots para representar el ranking
-    Los slots se colorean desde abajo (posición 22) hasta la posición del equipo
+    Carga los datos al arrancar el worker
+    Con snapshot compartido se arranca en milisegundos y el escritor reconcilia con la BD en segundo plano;
+    sin él se carga desde la base de datos (y el escritor guarda el snapshot para los demás). El worker
+    arranca en cuanto llegan los rankings (el diagrama ya se puede servir) y las tablas de partidos
+    terminan de cargarse en segundo plano; si en CONSULTA_TIMEOUT_SEGUNDOS no hay rankings arranca
+    sin datos y los publica cuando termina la carga
     """
-    # Si la métrica no está disponible, mostrar columna gris oscuro
-    if not disponible:
-        return crear_columna_no_disponible()
-    
-    ranking_col = f"{metrica_col}_ranking"
+    inicio = time.perf_counter()
+    snapshot = leer_snapshot_local() if SNAPSHOT_LOCAL else None
     
-    if ranking_col not in df.columns or metrica_col not in df.columns:
-        return crear_columna_no_disponible()
+    if snapshot is not None:
+        publicar_snapshot(snapshot)
+        print(f"Arranque desde snapshot local {snapshot.origen} en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        obtener_particiones()  # La lista del selector se consulta en segundo plano
+        if not adquirir_escritura_snapshot():
+            carga_inicial_completa.set()
+            return
+        
+        def reconciliar():
+            inicio_reconciliacion = time.perf_counter()
+            try:
+                refrescar_datos(timeout=None)
+            except Exception as e:
+                print(f"Error al reconciliar con la base de datos: {e}")
+            finally:
+                carga_inicial_completa.set()
+            print(f"Reconciliación con la base de datos en {time.perf_counter() - inicio_reconciliacion:.2f}s")
+        
+        threading.Thread(target=reconciliar, name='reconciliacion-datos', daemon=True).start()
+        return
     
-    # Obtener el ranking del equipo seleccionado
-    equipo_data = df[df['fullName'] == equipo_seleccionado]
-    if equipo_data.empty:
-        return crear_columna_no_disponible()
+    rankings_listos = threading.Event()
     
-    ranking_equipo = int(equipo_data[ranking_col].values[0])
-    color_equipo = get_color_by_ranking(ranking_equipo)
+    def publicar_rankings(provisional):
+        # Snapshot provisional solo con rankings hasta que lleguen partidos y físicas
+        if obtener_snapshot().leido_en is None:
+            publicar_snapshot(provisional)
+        rankings_listos.set()
     
-    # Crear los 22 slots (de posición 1 arriba a 22 abajo)
-    slots = []
-    for pos in range(1, 23):
-        # Encontrar qué equipo está en esta posición
-        equipo_en_pos = df[df[ranking_col] == pos]
-        
-        if not equipo_en_pos.empty:
-            nombre_equipo_pos = equipo_en_pos['fullName'].values[0]
-            valor_metrica = equipo_en_pos[metrica_col].values[0]
-            tooltip_text = f"#{pos} {nombre_equipo_pos}: {valor_metrica:.2f}"
-        else:
-            tooltip_text = f"Posición {pos}"
-        
-        # Colorear desde la posición del equipo hacia abajo (hasta 22)
-        # Es decir, si el equipo está en posición 5, se colorean del 5 al 22
-        if pos >= ranking_equipo:
-            slot_color = color_equipo
-        else:
-            # Slots vacíos (por encima del equipo - mejores posiciones)
-            slot_color = '#E8E8E8'  # Gris claro
-        
-        # Marcar la posición exacta del equipo seleccionado
-        is_equipo_pos = (pos == ranking_equipo)
-        
-        slot = html.Div(
-            '•' if is_equipo_pos else '',
-            title=tooltip_text,
-            style={
-                'height': '20px',
-                'backgroundColor': slot_color,
-                'borderBottom': '1px solid #fff',
-                'display': 'flex',
-                'alignItems': 'center',
-                'justifyContent': 'center',
-                'fontSize': '14px',
-                'fontWeight': 'bold',
-                'color': '#000' if is_equipo_pos else 'transparent',
-                'cursor': 'pointer',
-                'transition': 'all 0.2s',
-            }
-        )
-        slots.append(slot)
+    def cargar():
+        try:
+            # Sin timeout: este hilo termina cuando la carga se ha publicado (el arranque solo espera a los rankings)
+            refrescar_datos(timeout=None, al_cargar_rankings=publicar_rankings)
+        except Exception as e:
+            print(f"Error en la carga inicial: {e}")
+        finally:
+            rankings_listos.set()
+            carga_inicial_completa.set()
     
-    return html.Div(slots, style={'display': 'flex', 'flexDirection': 'column'})
+    threading.Thread(target=cargar, name='carga-inicial', daemon=True).start()
+    rankings_listos.wait(CONSULTA_TIMEOUT_SEGUNDOS)
+    if obtener_snapshot().leido_en is not None:
+        print(f"Arranque desde base de datos en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    else:
+        print(f"Arranque sin datos en {(time.perf_counter() - inicio) * 1000:.0f} ms: se publicarán al terminar la carga")
 
 
-def crear_tabla_diagrama(df, config, equipo_seleccionado):
+def _bucle_refresco(intervalo, parar):
     """
-    Crea la tabla visual del diagrama con métricas (sin jerarquía de bloques)
+    Bucle del hilo de recarga
+    Con snapshot compartido, cada SNAPSHOT_SONDEO_SEGUNDOS se sigue la versión publicada por el escritor;
+    el escritor (o cualquier proceso sin snapshot compartido) recarga desde la BD cada `intervalo` segundos.
+    Si una recarga falla se reintenta cuando el circuito vuelve a dejar consultar la BD, sin esperar al intervalo
     """
-    color_principal = config['color_principal']
-    
-    # Crear filas de la tabla usando una estructura de tabla HTML
-    # Cabecera de métricas
-    header_cells = [
-        html.Th(
-            'Pos',
-            style={
-                'backgroundColor': '#f0f0f0',
-                'padding': '15px 8px',
-                'fontSize': '15px',
-                'fontWeight': '500',
-                'textAlign': 'center',
-                'width': '50px',
-                'minWidth': '50px',
-                'border': '1px solid #ccc',
-                'color': '#6c757d',
-            }
-        )
-    ]
-    
-    # Añadir cabeceras de métricas
-    for metrica in config['metricas']:
-        disponible = metrica.get('disponible', True)
-        es_vacia = metrica.get('vacia', False)
-        
-        # Columnas vacías tienen fondo gris claro
-        if es_vacia:
-            header_bg = '#d0d0d0'
-            header_color = '#666'
-        elif not disponible:
-            header_bg = '#4a4a4a'
-            header_color = '#999'
-        else:
-            header_bg = '#f0f0f0'
-            header_color = '#000'
-        
-        header_cells.append(
-            html.Th(
-                metrica['nombre'],
-                style={
-                    'backgroundColor': header_bg,
-                    'color': header_color,
-                    'padding': '15px 8px',
-                    'fontSize': '13px',
-                    'fontWeight': '500',
-                    'textAlign': 'center',
-                    'width': '85px',
-                    'minWidth': '85px',
-                    'border': '1px solid #ccc',
-                    'wordWrap': 'break-word',
-                }
-            )
-        )
+    sondeo = SNAPSHOT_SONDEO_SEGUNDOS if SNAPSHOT_LOCAL else min(intervalo, CIRCUITO_ESPERA_SEGUNDOS)
+    proximo_refresco = time.monotonic() + intervalo
+    while not parar.wait(sondeo):
+        try:
+            if _ultimo_refresco['ok'] is False:
+                # La última carga falló (también la inicial, que termina después de arrancar este hilo)
+                proximo_refresco = min(proximo_refresco, time.monotonic() + circuito_bd.segundos_para_reintentar())
+            if SNAPSHOT_LOCAL and not adquirir_escritura_snapshot():
+                seguir_snapshot_compartido()
+            elif intervalo > 0 and time.monotonic() >= proximo_refresco:
+                if refrescar_datos():
+                    proximo_refresco = time.monotonic() + intervalo
+                else:
+                    proximo_refresco = time.monotonic() + max(circuito_bd.segundos_para_reintentar(), sondeo)
+        except Exception as e:
+            print(f"Error en la recarga de datos: {e}")
+
+
+_exportacion = {'hilo': None, 'pendiente': False}
+_exportacion_lock = threading.Lock()
+
+
+def exportar_en_segundo_plano(directorio=None):
+    """
+    Vuelve a exportar los ficheros estáticos en un proceso aparte (`python app.py --exportar`), que lee el
+    snapshot compartido recién guardado (o, sin él, la BD); así no se hace fork de un worker con hilos.
+    Si ya hay una exportación en curso, se repite al terminar con los datos nuevos
+    """
+    directorio = directorio or EXPORTACION_DIR
     
-    # Crear filas del body (22 posiciones)
-    body_rows = []
-    for pos in range(1, 23):
-        row_cells = [
-            html.Td(
-                str(pos),
-                style={
-                    'backgroundColor': '#f9f9f9',
-                    'textAlign': 'center',
-                    'fontSize': '14px',
-                    'fontWeight': '500',
-                    'padding': '0',
-                    'height': '28px',
-                    'width': '50px',
-                    'border': '1px solid #eee',
-                    'color': '#6c757d',
-                }
-            )
-        ]
-        
-        # Añadir celdas de cada métrica para esta posición
-        for metrica in config['metricas']:
-            disponible = metrica.get('disponible', True)
-            es_vacia = metrica.get('vacia', False)
-            metrica_col = metrica['columna']
-            ranking_col = f"{metrica_col}_ranking"
-            
-            # Columna vacía: sin relleno, sin tooltip, sin interacción
-            if es_vacia:
-                cell_style = {
-                    'backgroundColor': '#e8e8e8',
-                    'height': '28px',
-                    'width': '85px',
-                    'border': '1px solid #ccc',
-                    'padding': '0',
-                }
-                row_cells.append(
-                    html.Td(
-                        '',
-                        style=cell_style
-                    )
-                )
-            elif not disponible or ranking_col not in df.columns or metrica_col not in df.columns:
-                # Métrica no disponible
-                cell_style = {
-                    'backgroundColor': '#4a4a4a',
-                    'height': '28px',
-                    'width': '85px',
-                    'border': '1px solid #333',
-                    'padding': '0',
-                }
-                tooltip = "Datos no disponibles"
-                cell_content = ''
-                row_cells.append(
-                    html.Td(
-                        cell_content,
-                        title=tooltip,
-                        style=cell_style
-                    )
+    def exportar():
+        while True:
+            with _exportacion_lock:
+                if not _exportacion['pendiente']:
+                    _exportacion['hilo'] = None
+                    return
+                _exportacion['pendiente'] = False
+            entorno = dict(os.environ, EXPORTACION_DIR='', REFRESCO_DATOS_SEGUNDOS='0')
+            try:
+                resultado = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--exportar', directorio],
+                    env=entorno, capture_output=True, text=True,
                 )
-            else:
-                # Obtener datos del equipo seleccionado
-                equipo_data = df[df['fullName'] == equipo_seleccionado]
-                if not equipo_data.empty:
-                    ranking_equipo = int(equipo_data[ranking_col].values[0])
-                    color_equipo = get_color_by_ranking(ranking_equipo)
-                    
-                    # Encontrar TODOS los equipos que están en esta posición
-                    equipos_en_pos = df[df[ranking_col] == pos]
-                    if not equipos_en_pos.empty:
-                        # Obtener todos los nombres y el valor (es el mismo para todos)
-                        nombres_equipos = equipos_en_pos['fullName'].tolist()
-                        valor_metrica = equipos_en_pos[metrica_col].values[0]
-                        
-                        if len(nombres_equipos) > 1:
-                            # Múltiples equipos comparten esta posición
-                            nombres_str = ', '.join(nombres_equipos)
-                            tooltip = f"#{pos} ({len(nombres_equipos)} equipos): {nombres_str} - Valor: {valor_metrica:.2f}"
-                        else:
-                            # Solo un equipo en esta posición
-                            tooltip = f"#{pos} {nombres_equipos[0]}: {valor_metrica:.2f}"
-                    else:
-                        # Posición vacía por empate: buscar equipos en la posición superior más cercana
-                        # Buscar la posición más alta que tenga equipos y que "cubra" esta posición
-                        posicion_encontrada = None
-                        for pos_buscar in range(pos - 1, 0, -1):
-                            equipos_pos_superior = df[df[ranking_col] == pos_buscar]
-                            if not equipos_pos_superior.empty:
-                                num_equipos = len(equipos_pos_superior)
-                                # Si hay empate, estos equipos "ocupan" las posiciones desde pos_buscar hasta pos_buscar + num_equipos - 1
-                                if pos_buscar + num_equipos - 1 >= pos:
-                                    posicion_encontrada = pos_buscar
-                                    break
-                                else:
-                                    break  # No hay empate que cubra esta posición
-                        
-                        if posicion_encontrada is not None:
-                            equipos_empatados = df[df[ranking_col] == posicion_encontrada]
-                            nombres_equipos = equipos_empatados['fullName'].tolist()
-                            valor_metrica = equipos_empatados[metrica_col].values[0]
-                            nombres_str = ', '.join(nombres_equipos)
-                            tooltip = f"#{posicion_encontrada} ({len(nombres_equipos)} equipos): {nombres_str} - Valor: {valor_metrica:.2f}"
-                        else:
-                            tooltip = f"Posición {pos}"
-                    
-                    # Colorear desde la posición del equipo hacia abajo
-                    if pos >= ranking_equipo:
-                        cell_color = color_equipo
-                    else:
-                        cell_color = '#E8E8E8'
-                    
-                    is_equipo_pos = (pos == ranking_equipo)
+                if resultado.returncode != 0:
+                    print(f"Exportación estática fallida: {resultado.stderr.strip()[-500:]}")
                 else:
-                    cell_color = '#E8E8E8'
-                    tooltip = f"Posición {pos}"
-                    is_equipo_pos = False
-                
-                cell_style = {
-                    'backgroundColor': cell_color,
-                    'height': '28px',
-                    'width': '85px',
-                    'border': '1px solid #fff',
-                    'padding': '0',
-                    'textAlign': 'center',
-                    'cursor': 'pointer',
-                }
-                cell_content = '•' if is_equipo_pos else ''
-                
-                row_cells.append(
-                    html.Td(
-                        cell_content,
-                        title=tooltip,
-                        style=cell_style
-                    )
-                )
-        
-        body_rows.append(html.Tr(row_cells))
-    
-    # Crear tabla
-    tabla = html.Table([
-        html.Thead(html.Tr(header_cells)),
-        html.Tbody(body_rows)
-    ], style={
-        'borderCollapse': 'collapse',
-        'width': 'auto',
-    })
+                    print(f"Exportación estática en {directorio} actualizada")
+            except OSError as e:
+                print(f"No se pudo lanzar la exportación estática: {e}")
     
-    # Leyenda
-    leyenda = html.Div([
-        html.Span('■ 1-6', style={'color': '#00B050', 'marginRight': '20px', 'fontSize': '15px', 'fontWeight': '500'}),
-        html.Span('■ 7-16', style={'color': '#FFD700', 'marginRight': '20px', 'fontSize': '15px', 'fontWeight': '500'}),
-        html.Span('■ 17-22', style={'color': '#FF0000', 'fontSize': '15px', 'fontWeight': '500'}),
-    ], style={'textAlign': 'center', 'padding': '15px', 'marginTop': '15px'})
-    
-    return html.Div([
-        tabla,
-        leyenda,
-    ], style={
-        'overflow': 'auto',
-        'maxWidth': '100%',
-        'display': 'flex',
-        'flexDirection': 'column',
-        'alignItems': 'center',
-    })
+    with _exportacion_lock:
+        _exportacion['pendiente'] = True
+        if _exportacion['hilo'] is not None:
+            return
+        _exportacion['hilo'] = threading.Thread(target=exportar, name='exportacion-estatica', daemon=True)
+        _exportacion['hilo'].start()
+
+
+def iniciar_refresco_periodico(intervalo=REFRESCO_DATOS_SEGUNDOS):
+    """
+    Arranca el hilo de recarga en segundo plano (uno por worker de gunicorn)
+    Devuelve el evento que permite detenerlo, o None si está desactivado
+    """
+    if intervalo <= 0 and not SNAPSHOT_LOCAL:
+        return None
+    parar = threading.Event()
+    hilo = threading.Thread(target=_bucle_refresco, args=(intervalo, parar), name='refresco-datos', daemon=True)
+    hilo.start()
+    return parar
 
 
 # ============================================================================
@@ -466,105 +2792,202 @@ def crear_tabla_diagrama(df, config, equipo_seleccionado):
 # ============================================================================
 
 # Cargar datos iniciales
-df_rankings = cargar_datos_rankings()
-df_partidos = cargar_datos_partidos()
-df_fisicas = cargar_datos_fisicas()
+cargar_datos_iniciales()
+parar_refresco = iniciar_refresco_periodico()
 
 # Crear aplicación
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 server = app.server  # Necesario para Render/Gunicorn
 app.title = "Dashboard Rankings - TruMedia"
 
-# Layout
-app.layout = html.Div([
-    # Header
-    html.Div([
-        html.H1("Dashboard de Rankings de Equipos", 
-                style={'textAlign': 'center', 'color': '#333', 'marginBottom': '20px'}),
-    ], style={'padding': '20px', 'backgroundColor': '#f5f5f5'}),
-    
-    # Botones de navegación
-    html.Div([
-        html.Button(
-            'DIAGRAMAS DE ESTILO',
-            id='btn-estilo',
-            n_clicks=0,
-            style={
-                'backgroundColor': '#FFD700',
-                'color': '#000',
-                'border': 'none',
-                'borderBottom': '3px solid transparent',
-                'borderRadius': '0',
-                'padding': '15px 30px',
-                'fontSize': '15px',
-                'fontWeight': '500',
-                'cursor': 'pointer',
-                'marginRight': '20px',
-                'textAlign': 'center',
-            }
-        ),
-        html.Button(
-            'DIAGRAMAS DE RENDIMIENTO',
-            id='btn-rendimiento',
-            n_clicks=0,
-            style={
-                'backgroundColor': '#00B050',
-                'color': '#fff',
-                'border': 'none',
-                'borderBottom': '3px solid transparent',
-                'borderRadius': '0',
-                'padding': '15px 30px',
-                'fontSize': '15px',
-                'fontWeight': '500',
-                'cursor': 'pointer',
-                'textAlign': 'center',
-            }
-        ),
-    ], style={'textAlign': 'center', 'padding': '20px'}),
-    
-    # Selector de equipo
-    html.Div([
-        html.Label('Seleccionar Equipo:', style={'fontWeight': 'bold', 'marginRight': '10px'}),
-        dcc.Dropdown(
-            id='selector-equipo',
-            options=[{'label': equipo, 'value': equipo} for equipo in sorted(df_rankings['fullName'].unique())] if not df_rankings.empty else [],
-            value=df_rankings['fullName'].iloc[0] if not df_rankings.empty else None,
-            style={'width': '300px', 'display': 'inline-block'},
-            clearable=False,
-        ),
-    ], style={'textAlign': 'center', 'padding': '20px'}),
-    
-    # Store para el diagrama activo
-    dcc.Store(id='diagrama-activo', data='estilo'),
-    
-    # Contenedor del diagrama
-    html.Div(id='contenedor-diagrama', style={'padding': '20px', 'overflowX': 'auto'}),
-    
-    # Separador
-    html.Hr(style={'margin': '30px 0'}),
-    
-    # Sección del gráfico de barras
-    html.Div([
-        html.H3("Evolución por Partido", style={'textAlign': 'center', 'marginBottom': '20px'}),
-        
-        # Selector de métrica
+
+@server.route('/estadisticas-cache')
+def ruta_estadisticas_caches():
+    """Aciertos, fallos y tamaño de las cachés de este worker y cálculos coalescidos (JSON)"""
+    return dict(estadisticas_caches(), coalescencia=vuelos_callbacks.estadisticas())
+
+
+if METRICAS_ACTIVAS:
+    server.after_request(registrar_bytes_callback)
+
+
+@server.route('/metrics')
+def ruta_metricas():
+    """Métricas de este worker en formato de texto de Prometheus (404 si están desactivadas)"""
+    if not METRICAS_ACTIVAS:
+        flask.abort(404)
+    return flask.Response(exponer_metricas(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def obtener_matriz_rankings(snapshot):
+    """Matriz compacta de rankings del snapshot (se calcula una vez por versión de datos)"""
+    matriz = cache_matrices.obtener(snapshot.version_rankings)
+    if matriz is None:
+        matriz = construir_matriz_rankings(snapshot.indice_rankings, snapshot.version_rankings)
+        cache_matrices.guardar(snapshot.version_rankings, matriz)
+    return matriz
+
+
+def config_grafico_evolucion():
+    """Datos fijos que necesita el gráfico de evolución en el navegador (plantilla de plotly y nombres)"""
+    return {
+        'plantilla': figura_vacia()['layout']['template'],
+        'nombres': {
+            diagrama: {m['columna']: m['nombre'] for m in config['metricas']}
+            for diagrama, config in (('estilo', ESTILO_CONFIG), ('rendimiento', RENDIMIENTO_CONFIG))
+        },
+    }
+
+
+def opciones_equipos(snapshot):
+    """Opciones y valor inicial del selector de equipo para un snapshot"""
+    df_rankings = snapshot.df_rankings
+    if df_rankings.empty:
+        return [], None
+    opciones = [{'label': equipo, 'value': equipo} for equipo in sorted(df_rankings['fullName'].unique())]
+    return opciones, df_rankings['fullName'].iloc[0]
+
+
+def formatear_edad(segundos):
+    """Edad legible de los datos ('menos de un minuto', '5 min', '3 h', '2 días')"""
+    if segundos < 60:
+        return "menos de un minuto"
+    if segundos < 3600:
+        return f"{int(segundos // 60)} min"
+    if segundos < 86400:
+        return f"{int(segundos // 3600)} h"
+    dias = int(segundos // 86400)
+    return f"{dias} día" if dias == 1 else f"{dias} días"
+
+
+NOMBRES_TABLAS = {'rankings': 'los rankings', 'partidos': 'los partidos', 'fisicas': 'las métricas físicas'}
+
+
+def texto_edad_datos(snapshot):
+    """Aviso bajo la cabecera: antigüedad de los datos mostrados y si la BD no está respondiendo"""
+    # Una recarga parcial también deja ok=False, pero eso ya lo dice el aviso de tablas pendientes
+    bd_caida = circuito_bd.abierto or (_ultimo_refresco['ok'] is False and not snapshot.tablas_pendientes)
+    if snapshot.leido_en is None:
+        if bd_caida:
+            return "La base de datos no responde: se reintentará en unos segundos"
+        return "Cargando datos..."
+    texto = f"Datos actualizados hace {formatear_edad(time.time() - momento_datos(snapshot))}"
+    if snapshot.tablas_pendientes:
+        tablas = ' y '.join(NOMBRES_TABLAS.get(t, t) for t in snapshot.tablas_pendientes)
+        if _ultimo_refresco['en_curso']:
+            texto += f" (cargando {tablas}...)"
+        else:
+            texto += f" (no se pudieron cargar {tablas}: se reintentará en la siguiente recarga)"
+    if bd_caida:
+        texto += " (la base de datos no responde: se muestran los últimos datos disponibles)"
+    return texto
+
+
+def construir_layout():
+    """Layout de la aplicación (se construye en cada carga de página con el snapshot vigente)"""
+    snapshot = obtener_snapshot()
+    opciones, equipo_inicial = opciones_equipos(snapshot)
+    particiones = obtener_particiones()
+    return html.Div([
+        # Header
+        html.Div([
+            html.H1("Dashboard de Rankings de Equipos", 
+                    style={'textAlign': 'center', 'color': '#333', 'marginBottom': '20px'}),
+            
+            # Antigüedad de los datos (se actualiza cada minuto)
+            html.Div(texto_edad_datos(snapshot), id='edad-datos',
+                     style={'textAlign': 'center', 'color': '#6c757d', 'fontSize': '13px'}),
+            dcc.Interval(id='intervalo-edad-datos', interval=60 * 1000),
+        ], style={'padding': '20px', 'backgroundColor': '#f5f5f5'}),
+    
+        # Botones de navegación
+        html.Div([
+            html.Button(
+                'DIAGRAMAS DE ESTILO',
+                id='btn-estilo',
+                n_clicks=0,
+                className='btn-diagrama btn-estilo activo',
+            ),
+            html.Button(
+                'DIAGRAMAS DE RENDIMIENTO',
+                id='btn-rendimiento',
+                n_clicks=0,
+                className='btn-diagrama btn-rendimiento',
+            ),
+        ], style={'textAlign': 'center', 'padding': '20px'}),
+    
+        # Selector de competición y temporada (solo si hay más de una partición)
+        html.Div([
+            html.Label('Competición / Temporada:', style={'fontWeight': 'bold', 'marginRight': '10px'}),
+            dcc.Dropdown(
+                id='selector-particion',
+                options=[{'label': f"{competicion} {temporada}", 'value': clave_particion((competicion, temporada))}
+                         for competicion, temporada in particiones],
+                value=clave_particion(snapshot.particion),
+                style={'width': '300px', 'display': 'inline-block'},
+                clearable=False,
+            ),
+        ], style={'textAlign': 'center', 'padding': '20px 20px 0',
+                  'display': 'block' if len(particiones) > 1 else 'none'}),
+    
+        # Selector de equipo
         html.Div([
-            html.Label('Seleccionar Métrica:', style={'fontWeight': 'bold', 'marginRight': '10px'}),
+            html.Label('Seleccionar Equipo:', style={'fontWeight': 'bold', 'marginRight': '10px'}),
             dcc.Dropdown(
-                id='selector-metrica',
-                options=[],  # Se llenará dinámicamente
-                value=None,
+                id='selector-equipo',
+                options=opciones,
+                value=equipo_inicial,
                 style={'width': '300px', 'display': 'inline-block'},
                 clearable=False,
             ),
-        ], style={'textAlign': 'center', 'marginBottom': '20px'}),
+        ], style={'textAlign': 'center', 'padding': '20px'}),
+    
+        # Store para el diagrama activo
+        dcc.Store(id='diagrama-activo', data='estilo'),
+        
+        # Diagrama que tiene renderizado el navegador (para enviar solo los cambios)
+        dcc.Store(id='diagrama-renderizado', data=None),
+        
+        # Matriz de rankings para renderizar el diagrama en el navegador
+        dcc.Store(id='matriz-rankings', data=obtener_matriz_rankings(snapshot) if DIAGRAMA_EN_CLIENTE else None),
+        # Versión de datos de esa matriz (se compara sin volver a subir la matriz al servidor)
+        dcc.Store(id='version-matriz', data=snapshot.version_rankings if DIAGRAMA_EN_CLIENTE else None),
+    
+        # Contenedor del diagrama
+        html.Div(id='contenedor-diagrama', style={'padding': '20px', 'overflowX': 'auto'}),
+    
+        # Separador
+        html.Hr(style={'margin': '30px 0'}),
+    
+        # Sección del gráfico de barras
+        html.Div([
+            html.H3("Evolución por Partido", style={'textAlign': 'center', 'marginBottom': '20px'}),
+        
+            # Selector de métrica
+            html.Div([
+                html.Label('Seleccionar Métrica:', style={'fontWeight': 'bold', 'marginRight': '10px'}),
+                dcc.Dropdown(
+                    id='selector-metrica',
+                    options=[],  # Se llenará dinámicamente
+                    value=None,
+                    style={'width': '300px', 'display': 'inline-block'},
+                    clearable=False,
+                ),
+            ], style={'textAlign': 'center', 'marginBottom': '20px'}),
         
-        # Gráfico de barras
-        dcc.Graph(id='grafico-barras', style={'height': '400px'}),
+            # Gráfico de barras
+            dcc.Graph(id='grafico-barras', style={'height': '400px'}),
+            
+            # Datos por partido del equipo seleccionado y configuración del gráfico en el navegador
+            dcc.Store(id='datos-evolucion', data=None),
+            dcc.Store(id='config-grafico', data=config_grafico_evolucion() if GRAFICO_EN_CLIENTE else None),
         
-    ], style={'padding': '20px'}),
+        ], style={'padding': '20px'}),
     
-], style={'fontFamily': 'Arial, sans-serif', 'maxWidth': '98%', 'margin': '0 auto'})
+    ], style={'fontFamily': 'Arial, sans-serif', 'maxWidth': '98%', 'margin': '0 auto'})
+
+
+app.layout = construir_layout
 
 
 # ============================================================================
@@ -573,69 +2996,20 @@ app.layout = html.Div([
 
 @callback(
     Output('diagrama-activo', 'data'),
-    Output('btn-estilo', 'style'),
-    Output('btn-rendimiento', 'style'),
+    Output('btn-estilo', 'className'),
+    Output('btn-rendimiento', 'className'),
     Input('btn-estilo', 'n_clicks'),
     Input('btn-rendimiento', 'n_clicks'),
 )
+@instrumentar_callback
 def cambiar_diagrama(clicks_estilo, clicks_rendimiento):
     ctx = dash.callback_context
     
-    estilo_activo = {
-        'backgroundColor': '#FFD700',
-        'color': '#000',
-        'border': 'none',
-        'borderBottom': '3px solid #000',
-        'borderRadius': '0',
-        'padding': '15px 30px',
-        'fontSize': '15px',
-        'fontWeight': '500',
-        'cursor': 'pointer',
-        'marginRight': '20px',
-        'textAlign': 'center',
-    }
-    
-    estilo_inactivo = {
-        'backgroundColor': '#FFD700',
-        'color': '#000',
-        'border': 'none',
-        'borderBottom': '3px solid transparent',
-        'borderRadius': '0',
-        'padding': '15px 30px',
-        'fontSize': '15px',
-        'fontWeight': '500',
-        'cursor': 'pointer',
-        'marginRight': '20px',
-        'textAlign': 'center',
-        'opacity': '0.7',
-    }
-    
-    rendimiento_activo = {
-        'backgroundColor': '#00B050',
-        'color': '#fff',
-        'border': 'none',
-        'borderBottom': '3px solid #000',
-        'borderRadius': '0',
-        'padding': '15px 30px',
-        'fontSize': '15px',
-        'fontWeight': '500',
-        'cursor': 'pointer',
-        'textAlign': 'center',
-    }
-    
-    rendimiento_inactivo = {
-        'backgroundColor': '#00B050',
-        'color': '#fff',
-        'border': 'none',
-        'borderBottom': '3px solid transparent',
-        'borderRadius': '0',
-        'padding': '15px 30px',
-        'fontSize': '15px',
-        'fontWeight': '500',
-        'cursor': 'pointer',
-        'textAlign': 'center',
-        'opacity': '0.7',
-    }
+    # Los estilos de los botones están en assets/diagrama.css (clase 'activo')
+    estilo_activo = 'btn-diagrama btn-estilo activo'
+    estilo_inactivo = 'btn-diagrama btn-estilo'
+    rendimiento_activo = 'btn-diagrama btn-rendimiento activo'
+    rendimiento_inactivo = 'btn-diagrama btn-rendimiento'
     
     if not ctx.triggered:
         return 'estilo', estilo_activo, rendimiento_inactivo
@@ -649,18 +3023,114 @@ def cambiar_diagrama(clicks_estilo, clicks_rendimiento):
 
 
 @callback(
-    Output('contenedor-diagrama', 'children'),
-    Input('diagrama-activo', 'data'),
-    Input('selector-equipo', 'value'),
+    Output('selector-equipo', 'options'),
+    Output('selector-equipo', 'value'),
+    Input('selector-particion', 'value'),
+    prevent_initial_call=True,
+)
+@instrumentar_callback
+def actualizar_equipos(particion):
+    """Equipos de la competición y temporada seleccionadas"""
+    return opciones_equipos(obtener_snapshot(particion_desde_clave(particion)))
+
+
+@callback(
+    Output('edad-datos', 'children'),
+    Input('intervalo-edad-datos', 'n_intervals'),
+    Input('selector-particion', 'value'),
+    prevent_initial_call=True,
 )
-def actualizar_diagrama(diagrama_activo, equipo_seleccionado):
-    if not equipo_seleccionado or df_rankings.empty:
+@instrumentar_callback
+def actualizar_edad_datos(_, particion):
+    """Antigüedad de los datos de la partición mostrada"""
+    return texto_edad_datos(obtener_snapshot(particion_desde_clave(particion)))
+
+
+def actualizar_diagrama(diagrama_activo, equipo_seleccionado, particion=None):
+    snapshot = obtener_snapshot(particion_desde_clave(particion))
+    if not equipo_seleccionado or snapshot.df_rankings.empty:
         return html.Div("Seleccione un equipo", style={'textAlign': 'center', 'padding': '50px'})
     
-    if diagrama_activo == 'rendimiento':
-        return crear_tabla_diagrama(df_rankings, RENDIMIENTO_CONFIG, equipo_seleccionado)
-    else:
-        return crear_tabla_diagrama(df_rankings, ESTILO_CONFIG, equipo_seleccionado)
+    diagrama = 'rendimiento' if diagrama_activo == 'rendimiento' else 'estilo'
+    clave = (diagrama, equipo_seleccionado, snapshot.version_rankings)
+    resultado = cache_diagramas.obtener(clave)
+    if resultado is not None:
+        return resultado
+    
+    # Peticiones simultáneas del mismo diagrama (en este worker o en otros) comparten un único cálculo
+    config = RENDIMIENTO_CONFIG if diagrama == 'rendimiento' else ESTILO_CONFIG
+    resultado = vuelos_callbacks.ejecutar(
+        ('diagrama',) + clave,
+        lambda: serializar_componente(crear_tabla_diagrama(snapshot.indice_rankings, config, equipo_seleccionado)),
+        entre_workers=snapshot.version_compartida('rankings'),
+    )
+    cache_diagramas.guardar(clave, resultado)
+    return resultado
+
+
+def actualizar_diagrama_parcial(diagrama_activo, equipo_seleccionado, renderizado, particion=None):
+    """
+    Igual que actualizar_diagrama, pero si en el navegador ya está el mismo diagrama con los
+    mismos datos y solo cambia el equipo, devuelve un Patch con las celdas que cambian
+    """
+    snapshot = obtener_snapshot(particion_desde_clave(particion))
+    diagrama = 'rendimiento' if diagrama_activo == 'rendimiento' else 'estilo'
+    estado = {'diagrama': diagrama, 'equipo': equipo_seleccionado, 'datos': snapshot.id_datos}
+    
+    if (renderizado and renderizado.get('equipo') and equipo_seleccionado
+            and renderizado.get('diagrama') == diagrama
+            and renderizado.get('datos') == snapshot.id_datos):
+        config = RENDIMIENTO_CONFIG if diagrama == 'rendimiento' else ESTILO_CONFIG
+        cambios = diferencias_diagrama(snapshot.indice_rankings, config, renderizado['equipo'], equipo_seleccionado)
+        return parche_diagrama(cambios), estado
+    
+    return actualizar_diagrama(diagrama_activo, equipo_seleccionado, particion), estado
+
+
+if DIAGRAMA_EN_CLIENTE:
+    # El navegador construye la tabla a partir de la matriz de rankings (assets/diagrama_cliente.js)
+    clientside_callback(
+        ClientsideFunction(namespace='diagrama', function_name='renderizar'),
+        Output('contenedor-diagrama', 'children'),
+        Input('matriz-rankings', 'data'),
+        Input('diagrama-activo', 'data'),
+        Input('selector-equipo', 'value'),
+    )
+    
+    @callback(
+        Output('matriz-rankings', 'data'),
+        Output('version-matriz', 'data'),
+        Input('selector-particion', 'value'),
+        Input('intervalo-edad-datos', 'n_intervals'),
+        State('version-matriz', 'data'),
+        prevent_initial_call=True,
+    )
+    @instrumentar_callback
+    def actualizar_matriz_rankings(particion, _, version_navegador):
+        """
+        Matriz de rankings de la competición y temporada seleccionadas; con la página abierta se
+        vuelve a enviar solo cuando una recarga en segundo plano cambia la versión de los rankings
+        """
+        snapshot = obtener_snapshot(particion_desde_clave(particion))
+        if version_navegador == snapshot.version_rankings:
+            return dash.no_update, dash.no_update
+        return obtener_matriz_rankings(snapshot), snapshot.version_rankings
+elif DIAGRAMA_PARCIAL:
+    callback(
+        Output('contenedor-diagrama', 'children'),
+        Output('diagrama-renderizado', 'data'),
+        Input('diagrama-activo', 'data'),
+        Input('selector-equipo', 'value'),
+        State('diagrama-renderizado', 'data'),
+        Input('selector-particion', 'value'),
+    )(instrumentar_callback(actualizar_diagrama_parcial))
+else:
+    callback(
+        Output('contenedor-diagrama', 'children'),
+        Input('diagrama-activo', 'data'),
+        Input('selector-equipo', 'value'),
+        Input('selector-particion', 'value'),
+    )(instrumentar_callback(actualizar_diagrama))
 
 
 @callback(
@@ -668,6 +3138,7 @@ def actualizar_diagrama(diagrama_activo, equipo_seleccionado):
     Output('selector-metrica', 'value'),
     Input('diagrama-activo', 'data'),
 )
+@instrumentar_callback
 def actualizar_opciones_metrica(diagrama_activo):
     """Actualiza las opciones del selector de métricas según el diagrama activo"""
     if diagrama_activo == 'rendimiento':
@@ -687,86 +3158,111 @@ def actualizar_opciones_metrica(diagrama_activo):
     return opciones, valor_default
 
 
-@callback(
-    Output('grafico-barras', 'figure'),
-    Input('selector-equipo', 'value'),
-    Input('selector-metrica', 'value'),
-    Input('diagrama-activo', 'data'),
-)
-def actualizar_grafico_barras(equipo_seleccionado, metrica_seleccionada, diagrama_activo):
-    """Genera el gráfico de barras con la evolución por partido"""
+def figura_a_dict(fig):
+    """Figura de plotly como dict JSON plano (lo que Dash envía al navegador)"""
+    return json.loads(json.dumps(fig.to_plotly_json(), cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def plantilla_grafico_barras():
+    """
+    Figura base del gráfico de evolución (plantilla de plotly, ejes, márgenes y fondo), común a los dos
+    diagramas (el color y los nombres se ponen al construir la figura), validada por plotly una sola vez
+    y reutilizada como dict plano
+    """
+    plantilla = cache_plantillas_grafico.obtener('barras')
+    if plantilla is None:
+        fig = go.Figure()
+        fig.update_layout(
+            xaxis=dict(
+                title='Rival (ordenado por fecha)',
+                tickangle=45,
+                tickfont=dict(size=10)
+            ),
+            showlegend=False,
+            margin=dict(b=120, t=30),  # Añadir margen superior
+            plot_bgcolor='white',
+            paper_bgcolor='white',
+        )
+        plantilla = figura_a_dict(fig)
+        cache_plantillas_grafico.guardar('barras', plantilla)
+    return plantilla
+
+
+def figura_vacia():
+    """Equivalente en dict de go.Figure()"""
+    return {'data': [], 'layout': {'template': plantilla_grafico_barras()['layout']['template']}}
+
+
+def figura_aviso(texto):
+    """Figura vacía con un texto centrado"""
+    figura = figura_vacia()
+    figura['layout']['annotations'] = [{
+        'font': {'size': 16},
+        'showarrow': False,
+        'text': texto,
+        'x': 0.5,
+        'xref': 'paper',
+        'y': 0.5,
+        'yref': 'paper',
+    }]
+    return figura
+
+
+def actualizar_grafico_barras(equipo_seleccionado, metrica_seleccionada, diagrama_activo, particion=None):
+    """
+    Genera el gráfico de barras con la evolución por partido
+    Devuelve la figura como dict plano sobre la plantilla cacheada del diagrama y la memoriza
+    por (equipo, métrica, diagrama, versión de datos), sin pasar por la validación de plotly
+    """
     if not equipo_seleccionado or not metrica_seleccionada:
-        return go.Figure()
+        return figura_vacia()
     
+    # Vista consistente de los datos durante todo el callback
+    snapshot = obtener_snapshot(particion_desde_clave(particion))
+    clave = (equipo_seleccionado, metrica_seleccionada, diagrama_activo, snapshot.version_partidos)
+    figura = cache_graficos.obtener(clave)
+    if figura is None:
+        try:
+            figura = vuelos_callbacks.ejecutar(
+                ('grafico',) + clave,
+                lambda: construir_grafico_barras(snapshot, equipo_seleccionado, metrica_seleccionada, diagrama_activo),
+                entre_workers=snapshot.version_compartida('rankings', 'partidos', 'fisicas'),
+            )
+        except ConsultaPartidosFallida:
+            return figura_aviso(AVISO_CONSULTA_FALLIDA)  # Sin cachear: se reintenta en la siguiente petición
+        cache_graficos.guardar(clave, figura)
+    return figura
+
+
+def construir_grafico_barras(snapshot, equipo_seleccionado, metrica_seleccionada, diagrama_activo):
+    """Figura de evolución por partido (dict) para un equipo y una métrica del snapshot"""
     # Determinar si es una métrica física
     es_metrica_fisica = metrica_seleccionada in METRICAS_FISICAS
     
+    # Partidos del equipo (del índice del snapshot o consultados bajo demanda)
+    tablas = tablas_equipo(snapshot, equipo_seleccionado)
+    
     if es_metrica_fisica:
         # Usar tabla de métricas físicas
-        if df_fisicas.empty:
-            return go.Figure().add_annotation(
-                text="No hay datos físicos disponibles",
-                xref="paper", yref="paper",
-                x=0.5, y=0.5, showarrow=False,
-                font=dict(size=16)
-            )
+        if not tablas['hay_fisicas']:
+            return figura_aviso("No hay datos físicos disponibles")
         
-        # Obtener el teamId del equipo seleccionado desde df_rankings
-        equipo_ranking = df_rankings[df_rankings['fullName'] == equipo_seleccionado]
-        if equipo_ranking.empty:
-            return go.Figure().add_annotation(
-                text="Equipo no encontrado",
-                xref="paper", yref="paper",
-                x=0.5, y=0.5, showarrow=False,
-                font=dict(size=16)
-            )
-        
-        team_id = equipo_ranking['teamId'].values[0]
-        
-        # Filtrar datos físicos del equipo
-        df_equipo = df_fisicas[df_fisicas['teamId'] == team_id].copy()
-        
-        if df_equipo.empty or metrica_seleccionada not in df_equipo.columns:
-            return go.Figure().add_annotation(
-                text="No hay datos disponibles para esta métrica",
-                xref="paper", yref="paper",
-                x=0.5, y=0.5, showarrow=False,
-                font=dict(size=16)
-            )
-        
-        # Ordenar por fecha
-        df_equipo = df_equipo.sort_values('gameDate')
+        # El teamId del equipo seleccionado viene de df_rankings
+        if equipo_seleccionado not in snapshot.indice_partidos['ids']:
+            return figura_aviso("Equipo no encontrado")
         
-        # Para métricas físicas, obtener el rival desde df_partidos
-        # Hacer merge con df_partidos para obtener oppFullName
-        if not df_partidos.empty and 'gameId' in df_partidos.columns:
-            df_partidos_equipo = df_partidos[df_partidos['fullName'] == equipo_seleccionado][['gameId', 'oppFullName']].drop_duplicates()
-            df_equipo = df_equipo.merge(df_partidos_equipo, on='gameId', how='left')
-            df_equipo['etiqueta'] = df_equipo['oppFullName'].fillna(df_equipo['gameDate'].astype(str))
-        else:
-            # Si no hay datos de partidos, usar la fecha como etiqueta
-            df_equipo['etiqueta'] = df_equipo['gameDate'].astype(str)
+        # Datos físicos del equipo, ya ordenados por fecha y con el rival unido
+        df_equipo = tablas['fisicas']
     else:
         # Usar tabla de partidos normal
-        if df_partidos.empty:
-            return go.Figure()
-        
-        # Filtrar datos del equipo seleccionado
-        df_equipo = df_partidos[df_partidos['fullName'] == equipo_seleccionado].copy()
+        if not tablas['hay_partidos']:
+            return figura_vacia()
         
-        if df_equipo.empty or metrica_seleccionada not in df_equipo.columns:
-            return go.Figure().add_annotation(
-                text="No hay datos disponibles para esta métrica",
-                xref="paper", yref="paper",
-                x=0.5, y=0.5, showarrow=False,
-                font=dict(size=16)
-            )
-        
-        # Ordenar por fecha
-        df_equipo = df_equipo.sort_values('gameDate')
-        
-        # Crear etiquetas para el eje X (rival)
-        df_equipo['etiqueta'] = df_equipo['oppFullName']
+        # Partidos del equipo seleccionado, ya ordenados por fecha
+        df_equipo = tablas['partidos']
+    
+    if df_equipo is None or metrica_seleccionada not in df_equipo.columns:
+        return figura_aviso("No hay datos disponibles para esta métrica")
     
     # Obtener el nombre de la métrica para el título
     if diagrama_activo == 'rendimiento':
@@ -783,53 +3279,318 @@ def actualizar_grafico_barras(equipo_seleccionado, metrica_seleccionada, diagram
     # Determinar color según el diagrama
     color_principal = '#FFD700' if diagrama_activo == 'estilo' else '#00B050'
     
-    # Crear gráfico de barras
-    fig = go.Figure()
-    
-    fig.add_trace(go.Bar(
-        x=df_equipo['etiqueta'],
-        y=df_equipo[metrica_seleccionada],
-        marker_color=color_principal,
-        text=df_equipo[metrica_seleccionada].round(2),
-        textposition='outside',
-        hovertemplate=(
-            '<b>%{x}</b><br>' +
-            f'{nombre_metrica}: ' + '%{y:.2f}<br>' +
-            '<extra></extra>'
-        )
-    ))
+    valores = valores_json(df_equipo[metrica_seleccionada])
+    serie = np.array(valores, dtype=float)
     
-    # Calcular el rango del eje Y para dejar espacio a las etiquetas
-    max_valor = df_equipo[metrica_seleccionada].max()
+    # Rango del eje Y con espacio para las etiquetas y línea de promedio (sin contar partidos sin dato)
+    hay_valores = not np.isnan(serie).all()
+    max_valor = float(np.nanmax(serie)) if hay_valores else np.nan
     y_max = max_valor * 1.15  # 15% extra para las etiquetas
+    promedio = float(np.nanmean(serie)) if hay_valores else np.nan
     
-    fig.update_layout(
-        xaxis=dict(
-            title='Rival (ordenado por fecha)',
-            tickangle=45,
-            tickfont=dict(size=10)
-        ),
-        yaxis=dict(
-            title=nombre_metrica,
-            range=[0, y_max],  # Fijar rango para que las etiquetas no se corten
-        ),
-        showlegend=False,
-        margin=dict(b=120, t=30),  # Añadir margen superior
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-    )
+    base = plantilla_grafico_barras()
+    return {
+        'data': [{
+            'type': 'bar',
+            'x': df_equipo['etiqueta'].astype(str).tolist(),
+            'y': valores,
+            'marker': {'color': color_principal},
+            'text': np.round(serie, 2).tolist(),
+            'textposition': 'outside',
+            'hovertemplate': (
+                '<b>%{x}</b><br>' +
+                f'{nombre_metrica}: ' + '%{y:.2f}<br>' +
+                '<extra></extra>'
+            ),
+        }],
+        'layout': {
+            **base['layout'],
+            'yaxis': {
+                'title': {'text': nombre_metrica},
+                'range': [0, y_max],  # Fijar rango para que las etiquetas no se corten
+            },
+            'shapes': [{
+                'line': {'color': 'red', 'dash': 'dash'},
+                'type': 'line',
+                'x0': 0, 'x1': 1, 'xref': 'x domain',
+                'y0': promedio, 'y1': promedio, 'yref': 'y',
+            }],
+            'annotations': [{
+                'showarrow': False,
+                'text': f"Promedio: {promedio:.2f}",
+                'x': 1, 'xanchor': 'right', 'xref': 'x domain',
+                'y': promedio, 'yanchor': 'bottom', 'yref': 'y',
+            }],
+        },
+    }
+
+
+def actualizar_datos_evolucion(equipo_seleccionado, particion=None):
+    """Datos por partido del equipo para el gráfico en el navegador (una vez por cambio de equipo)"""
+    if not equipo_seleccionado:
+        return None
+    
+    snapshot = obtener_snapshot(particion_desde_clave(particion))
+    clave = (equipo_seleccionado, snapshot.version_partidos)
+    datos = cache_evolucion.obtener(clave)
+    if datos is None:
+        try:
+            datos = vuelos_callbacks.ejecutar(
+                ('evolucion',) + clave,
+                lambda: construir_datos_evolucion(snapshot, equipo_seleccionado),
+                entre_workers=snapshot.version_compartida('rankings', 'partidos', 'fisicas'),
+            )
+        except ConsultaPartidosFallida:
+            # Sin cachear: el navegador muestra el aviso y la siguiente petición vuelve a consultar
+            aviso = {'aviso': AVISO_CONSULTA_FALLIDA}
+            return {'equipo': equipo_seleccionado, 'datos': snapshot.version_partidos,
+                    'metricas_fisicas': METRICAS_FISICAS, 'partidos': aviso, 'fisicas': aviso}
+        cache_evolucion.guardar(clave, datos)
+    return datos
+
+
+if GRAFICO_EN_CLIENTE:
+    # Cambiar de métrica no pasa por el servidor: el navegador redibuja las barras,
+    # la línea de promedio y el eje Y a partir de los datos del equipo (assets/grafico_cliente.js)
+    callback(
+        Output('datos-evolucion', 'data'),
+        Input('selector-equipo', 'value'),
+        Input('selector-particion', 'value'),
+    )(instrumentar_callback(actualizar_datos_evolucion))
     
-    # Añadir línea de promedio
-    promedio = df_equipo[metrica_seleccionada].mean()
-    fig.add_hline(
-        y=promedio,
-        line_dash="dash",
-        line_color="red",
-        annotation_text=f"Promedio: {promedio:.2f}",
-        annotation_position="top right"
+    clientside_callback(
+        ClientsideFunction(namespace='evolucion', function_name='figura'),
+        Output('grafico-barras', 'figure'),
+        Input('datos-evolucion', 'data'),
+        Input('selector-metrica', 'value'),
+        Input('diagrama-activo', 'data'),
+        State('config-grafico', 'data'),
     )
+else:
+    callback(
+        Output('grafico-barras', 'figure'),
+        Input('selector-equipo', 'value'),
+        Input('selector-metrica', 'value'),
+        Input('diagrama-activo', 'data'),
+        Input('selector-particion', 'value'),
+    )(instrumentar_callback(actualizar_grafico_barras))
+
+
+# ============================================================================
+# MEDICIÓN DE PAYLOAD
+# ============================================================================
+
+def bytes_json(valor):
+    """Tamaño en bytes de un valor tal y como Dash lo envía al navegador"""
+    return len(json.dumps(valor, cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8'))
+
+
+def medir_bytes_sesion(equipos=None, cambios_por_diagrama=5):
+    """
+    Bytes enviados en una sesión típica con diagrama completo frente a Patch:
+    cambiar de equipo varias veces en ESTILO, pasar a RENDIMIENTO y volver a cambiar de equipo
+    """
+    snapshot = obtener_snapshot()
+    if equipos is None:
+        equipos = sorted(snapshot.indice_partidos['ids'])[:cambios_por_diagrama + 1]
+    pasos = [('estilo', e) for e in equipos] + [('rendimiento', e) for e in reversed(equipos)]
+    
+    completo = 0
+    parcial = 0
+    renderizado = None
+    for diagrama, equipo in pasos:
+        completo += bytes_json(actualizar_diagrama(diagrama, equipo))
+        salida, renderizado = actualizar_diagrama_parcial(diagrama, equipo, renderizado)
+        parcial += bytes_json(salida) + bytes_json(renderizado)
+    
+    return {'pasos': len(pasos), 'bytes_completo': completo, 'bytes_parcial': parcial}
+
+
+# ============================================================================
+# EXPORTACIÓN ESTÁTICA
+# ============================================================================
+
+def slug(texto):
+    """Nombre de fichero a partir de un equipo o una métrica ('Córdoba CF' -> 'cordoba-cf')"""
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii')
+    partes = ''.join(c if c.isalnum() else ' ' for c in texto.lower()).split()
+    return '-'.join(partes) or 'sin-nombre'
+
+
+def componente_a_html(nodo):
+    """HTML estático de un árbol de componentes de dash.html ya serializado (ver serializar_componente)"""
+    if isinstance(nodo, list):
+        return ''.join(componente_a_html(n) for n in nodo)
+    if not isinstance(nodo, dict) or 'type' not in nodo:
+        return '' if nodo is None else escapar_html(str(nodo))
+    
+    etiqueta = nodo['type'].lower()
+    atributos = ''
+    for nombre, valor in nodo['props'].items():
+        if nombre == 'children' or valor is None:
+            continue
+        if nombre == 'style':
+            valor = ';'.join(
+                f"{''.join('-' + c.lower() if c.isupper() else c for c in k)}:{v}" for k, v in valor.items())
+        atributos += f' {"class" if nombre == "className" else nombre}="{escapar_html(str(valor))}"'
+    return f"<{etiqueta}{atributos}>{componente_a_html(nodo['props'].get('children'))}</{etiqueta}>"
+
+
+def pagina_html(titulo, cuerpo, css=()):
+    """Documento HTML completo con las hojas de estilo `css` (rutas relativas)"""
+    enlaces = ''.join(f'<link rel="stylesheet" href="{ruta}">' for ruta in css)
+    return (f'<!DOCTYPE html><html lang="es"><head><meta charset="utf-8"><title>{escapar_html(titulo)}</title>'
+            f'{enlaces}</head><body>{cuerpo}</body></html>')
+
+
+def _exportar_texto(ruta, texto):
+    """Escribe un fichero de la exportación y devuelve sus bytes"""
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write(texto)
+    return len(texto.encode('utf-8'))
+
+
+def _exportar_json(ruta, valor):
+    """Escribe un JSON de la exportación (figuras con PlotlyJSONEncoder) y devuelve sus bytes"""
+    return _exportar_texto(ruta, json.dumps(valor, cls=plotly.utils.PlotlyJSONEncoder, ensure_ascii=False))
+
+
+def metricas_exportables(config):
+    """Métricas con gráfico de evolución de un diagrama (las del selector de métricas)"""
+    return [m for m in config['metricas'] if m.get('disponible', True)]
+
+
+def exportar_equipo(directorio, equipo, particion=None):
+    """
+    Escribe en `directorio/<equipo>/` los dos diagramas, el gráfico de evolución de cada métrica de cada
+    diagrama (JSON de Dash/plotly y HTML) y los datos de evolución del equipo. Se ejecuta en el pool de procesos
+    """
+    snapshot = obtener_snapshot(particion)
+    carpeta = os.path.join(directorio, slug(equipo))
+    os.makedirs(carpeta, exist_ok=True)
+    inicio = time.perf_counter()
+    ficheros = 0
+    total_bytes = 0
+    
+    for diagrama, config in (('estilo', ESTILO_CONFIG), ('rendimiento', RENDIMIENTO_CONFIG)):
+        tabla = serializar_componente(crear_tabla_diagrama(snapshot.indice_rankings, config, equipo))
+        total_bytes += _exportar_json(os.path.join(carpeta, f"diagrama-{diagrama}.json"), tabla)
+        total_bytes += _exportar_texto(
+            os.path.join(carpeta, f"diagrama-{diagrama}.html"),
+            pagina_html(f"{equipo} - {config['titulo_principal']}", componente_a_html(tabla), css=('../diagrama.css',)),
+        )
+        ficheros += 2
+        
+        for metrica in metricas_exportables(config):
+            figura = construir_grafico_barras(snapshot, equipo, metrica['columna'], diagrama)
+            nombre = f"grafico-{diagrama}-{slug(metrica['columna'])}"
+            total_bytes += _exportar_json(os.path.join(carpeta, f"{nombre}.json"), figura)
+            total_bytes += _exportar_texto(
+                os.path.join(carpeta, f"{nombre}.html"),
+                pio.to_html(figura, include_plotlyjs='cdn', full_html=True, validate=False),
+            )
+            ficheros += 2
+    
+    total_bytes += _exportar_json(os.path.join(carpeta, 'evolucion.json'), construir_datos_evolucion(snapshot, equipo))
+    ficheros += 1
+    return {'equipo': equipo, 'ficheros': ficheros, 'bytes': total_bytes,
+            'segundos': round(time.perf_counter() - inicio, 3)}
+
+
+EXPORTACION_VERSIONES_CONSERVADAS = 2
+
+
+def publicar_exportacion(directorio, version):
+    """
+    Apunta `directorio` (un enlace simbólico) a la carpeta `version` con un único renombrado atómico:
+    quien sirve los ficheros ve siempre la exportación anterior completa o la nueva completa
+    """
+    if os.path.isdir(directorio) and not os.path.islink(directorio):
+        # Exportación de antes del enlace simbólico: pasa a ser una versión más (solo la primera vez)
+        os.replace(directorio, os.path.join(os.path.dirname(version), 'v0'))
+    enlace = f"{directorio}.tmp-{os.getpid()}"
+    if os.path.lexists(enlace):
+        os.remove(enlace)
+    os.symlink(os.path.relpath(version, os.path.dirname(directorio)), enlace)
+    os.replace(enlace, directorio)
+
+
+def exportar_estatico(directorio, procesos=None, particion=None):
+    """
+    Prerenderiza todas las vistas del snapshot vigente (equipos x {ESTILO, RENDIMIENTO} y un gráfico
+    de evolución por métrica) como ficheros estáticos, repartiendo los equipos en un pool de procesos.
+    Cada exportación se escribe en una carpeta nueva de `<directorio>.versiones/` y `directorio` es un
+    enlace simbólico que se cambia al terminar (ver publicar_exportacion), así quien lo sirva (disco o CDN)
+    nunca ve una exportación a medias; un lock evita que dos exportaciones se pisen.
+    Devuelve un resumen con el tiempo de pared total
+    """
+    inicio = time.perf_counter()
+    snapshot = obtener_snapshot(particion)
+    if snapshot.df_rankings.empty:
+        raise RuntimeError("No hay datos que exportar")
+    equipos = [opcion['value'] for opcion in opciones_equipos(snapshot)[0]]
+    
+    directorio = os.path.abspath(directorio)
+    versiones = f"{directorio}.versiones"
+    os.makedirs(versiones, exist_ok=True)
+    fd = os.open(os.path.join(versiones, '.exportacion.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        version = os.path.join(versiones, f"v{time.time_ns()}")
+        os.makedirs(version)
+        shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'diagrama.css'), version)
+        
+        try:
+            # Con fork los procesos heredan el snapshot ya cargado (sin volver a leer la BD)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=procesos or os.cpu_count()) as pool:
+                tareas = [pool.submit(exportar_equipo, version, equipo, particion) for equipo in equipos]
+                resultados = [tarea.result() for tarea in tareas]
+            
+            manifiesto = {
+                'generado_en': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'particion': snapshot.particion,
+                'version_rankings': snapshot.version_rankings,
+                'version_partidos': snapshot.version_partidos,
+                'tablas_pendientes': list(snapshot.tablas_pendientes),
+                'equipos': {equipo: slug(equipo) for equipo in equipos},
+                'metricas': {
+                    diagrama: {m['columna']: slug(m['columna']) for m in metricas_exportables(config)}
+                    for diagrama, config in (('estilo', ESTILO_CONFIG), ('rendimiento', RENDIMIENTO_CONFIG))
+                },
+            }
+            _exportar_json(os.path.join(version, 'manifiesto.json'), manifiesto)
+            enlaces = ''.join(
+                f'<li>{escapar_html(equipo)}: <a href="{slug(equipo)}/diagrama-estilo.html">Estilo</a> · '
+                f'<a href="{slug(equipo)}/diagrama-rendimiento.html">Rendimiento</a></li>'
+                for equipo in equipos
+            )
+            _exportar_texto(os.path.join(version, 'index.html'),
+                            pagina_html('Rankings TruMedia', f"<h1>Rankings TruMedia</h1><ul>{enlaces}</ul>"))
+            publicar_exportacion(directorio, version)
+        except BaseException:
+            shutil.rmtree(version, ignore_errors=True)
+            raise
+        
+        # Se conservan las últimas versiones: alguien puede estar leyendo la anterior
+        for antigua in sorted(os.listdir(versiones), key=lambda n: int(n[1:]) if n[1:].isdigit() else -1)[
+                :-EXPORTACION_VERSIONES_CONSERVADAS]:
+            if antigua.startswith('v'):
+                shutil.rmtree(os.path.join(versiones, antigua), ignore_errors=True)
+    finally:
+        os.close(fd)  # Libera el lock
     
-    return fig
+    segundos = time.perf_counter() - inicio
+    return {
+        'directorio': directorio,
+        'version': os.path.basename(version),
+        'equipos': len(equipos),
+        'ficheros': sum(r['ficheros'] for r in resultados) + 3,
+        'bytes': sum(r['bytes'] for r in resultados),
+        'procesos': procesos or os.cpu_count(),
+        'segundos_por_equipo_suma': round(sum(r['segundos'] for r in resultados), 3),
+        'segundos_totales': round(segundos, 3),
+    }
 
 
 # ============================================================================
@@ -837,5 +3598,25 @@ def actualizar_grafico_barras(equipo_seleccionado, metrica_seleccionada, diagram
 # ============================================================================
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Dashboard Rankings TruMedia")
+    parser.add_argument('--medir-payload', action='store_true',
+                        help='Bytes enviados en una sesión típica (diagrama completo frente a Patch)')
+    parser.add_argument('--exportar', nargs='?', const=EXPORTACION_DIR or 'exportacion', metavar='DIR',
+                        help='Exportar todas las vistas como ficheros estáticos (por defecto EXPORTACION_DIR)')
+    parser.add_argument('--procesos', type=int, help='Procesos de la exportación (por defecto, uno por CPU)')
+    args = parser.parse_args()
+    
+    if args.medir_payload:
+        print(json.dumps(medir_bytes_sesion(), indent=2))
+        sys.exit(0)
+    
+    if args.exportar:
+        # Espera a que terminen de cargarse las tablas de partidos antes de exportar
+        carga_inicial_completa.wait()
+        resumen = exportar_estatico(args.exportar, procesos=args.procesos)
+        print(f"Exportación estática: {resumen['ficheros']} ficheros en {resumen['segundos_totales']:.2f}s")
+        print(json.dumps(resumen, indent=2))
+        sys.exit(0)
+    
     port = int(os.environ.get("PORT", 8050))
     app.run(debug=False, host='0.0.0.0', port=port)
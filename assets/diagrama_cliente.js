@@ -0,0 +1,91 @@
+/*
+ * Renderizado del diagrama de rankings en el navegador (DIAGRAMA_EN_CLIENTE=1)
+ *
+ * El servidor envía una vez por versión de datos la matriz compacta de rankings
+ * (ver construir_matriz_rankings en app.py) y este callback construye la tabla
+ * para el equipo seleccionado sin volver al servidor. La estructura y las clases
+ * deben coincidir con crear_tabla_diagrama (estilos en assets/diagrama.css).
+ */
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    diagrama: {
+        renderizar: function (matriz, diagramaActivo, equipoSeleccionado) {
+            var NS = 'dash_html_components';
+
+            function el(tipo, children, props) {
+                var p = Object.assign({}, props || {});
+                if (children !== undefined) { p.children = children; }
+                return {type: tipo, namespace: NS, props: p};
+            }
+
+            if (!equipoSeleccionado || !matriz || !matriz.equipos.length) {
+                return el('Div', 'Seleccione un equipo', {style: {textAlign: 'center', padding: '50px'}});
+            }
+
+            var diagrama = matriz.diagramas[diagramaActivo === 'rendimiento' ? 'rendimiento' : 'estilo'];
+            var idxEquipo = matriz.equipos.indexOf(equipoSeleccionado);
+
+            function clasePorRanking(ranking) {
+                if (ranking <= matriz.bandas[0]) { return 'v'; }
+                if (ranking <= matriz.bandas[1]) { return 'a'; }
+                return 'r';
+            }
+
+            function tooltip(pos, entrada) {
+                if (!entrada) { return 'Posición ' + pos; }
+                var nombres = entrada[1].map(function (i) { return matriz.equipos[i]; });
+                if (nombres.length > 1) {
+                    return '#' + entrada[0] + ' (' + nombres.length + ' equipos): ' + nombres.join(', ') + ' - Valor: ' + entrada[2];
+                }
+                return '#' + entrada[0] + ' ' + nombres[0] + ': ' + entrada[2];
+            }
+
+            // Cabecera
+            var cabecera = [el('Th', 'Pos', {className: 'pos'})];
+            diagrama.metricas.forEach(function (m) {
+                if (m.e === 'vacia') { cabecera.push(el('Th', m.n, {className: 'vac'})); }
+                else if (m.e === 'nd') { cabecera.push(el('Th', m.n, {className: 'nd'})); }
+                else { cabecera.push(el('Th', m.n)); }
+            });
+
+            // Cuerpo (una fila por posición)
+            var filas = [];
+            for (var pos = 1; pos <= matriz.posiciones; pos++) {
+                var celdas = [el('Td', String(pos), {className: 'pos'})];
+                diagrama.metricas.forEach(function (m) {
+                    if (m.e === 'vacia') {
+                        celdas.push(el('Td', undefined, {className: 'vac'}));
+                        return;
+                    }
+                    if (m.e === 'nd') {
+                        celdas.push(el('Td', undefined, {title: 'Datos no disponibles', className: 'nd'}));
+                        return;
+                    }
+                    var ranking = idxEquipo >= 0 ? m.r[idxEquipo] : null;
+                    var clase = '', titulo = 'Posición ' + pos;
+                    if (ranking !== null && ranking !== undefined) {
+                        titulo = tooltip(pos, m.p[pos - 1]);
+                        if (pos >= ranking) { clase = clasePorRanking(ranking); }
+                        if (pos === ranking) { clase = (clase + ' sel').trim(); }
+                    }
+                    var props = {title: titulo};
+                    if (clase) { props.className = clase; }
+                    celdas.push(el('Td', undefined, props));
+                });
+                filas.push(el('Tr', celdas));
+            }
+
+            var tabla = el('Table', [
+                el('Thead', el('Tr', cabecera)),
+                el('Tbody', filas)
+            ]);
+
+            var leyenda = el('Div', [
+                el('Span', '■ 1-' + matriz.bandas[0], {className: 'ley-v'}),
+                el('Span', '■ ' + (matriz.bandas[0] + 1) + '-' + matriz.bandas[1], {className: 'ley-a'}),
+                el('Span', '■ ' + (matriz.bandas[1] + 1) + '-' + matriz.posiciones, {className: 'ley-r'})
+            ], {className: 'leyenda'});
+
+            return el('Div', [tabla, leyenda], {className: 'diagrama'});
+        }
+    }
+});
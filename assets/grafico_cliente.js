@@ -0,0 +1,92 @@
+/*
+ * Gráfico de evolución por partido en el navegador (GRAFICO_EN_CLIENTE=1)
+ *
+ * Al cambiar de equipo el servidor envía los valores por partido de todas las
+ * métricas (ver construir_datos_evolucion en app.py). Cambiar de métrica o de
+ * diagrama solo redibuja aquí las barras, la línea de promedio y el eje Y.
+ * La figura debe coincidir con la de actualizar_grafico_barras.
+ */
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    evolucion: {
+        figura: function (datos, metrica, diagramaActivo, config) {
+            var plantilla = config ? config.plantilla : undefined;
+
+            function figuraVacia() {
+                return {data: [], layout: {template: plantilla}};
+            }
+
+            function aviso(texto) {
+                var fig = figuraVacia();
+                fig.layout.annotations = [{
+                    text: texto, xref: 'paper', yref: 'paper',
+                    x: 0.5, y: 0.5, showarrow: false, font: {size: 16}
+                }];
+                return fig;
+            }
+
+            if (!datos || !metrica || !config) {
+                return figuraVacia();
+            }
+
+            var bloque = datos.metricas_fisicas.indexOf(metrica) >= 0 ? datos.fisicas : datos.partidos;
+            if (bloque.aviso !== undefined) {
+                return bloque.aviso === null ? figuraVacia() : aviso(bloque.aviso);
+            }
+
+            var y = bloque.y[metrica];
+            if (!y) {
+                return aviso('No hay datos disponibles para esta métrica');
+            }
+
+            var nombres = config.nombres[diagramaActivo === 'rendimiento' ? 'rendimiento' : 'estilo'];
+            var nombreMetrica = nombres[metrica] || metrica;
+            var colorPrincipal = diagramaActivo === 'estilo' ? '#FFD700' : '#00B050';
+
+            // Máximo y promedio sin contar los partidos sin dato (como pandas)
+            var validos = y.filter(function (v) { return v !== null && !isNaN(v); });
+            var maxValor = validos.length ? Math.max.apply(null, validos) : null;
+            var promedio = validos.length
+                ? validos.reduce(function (a, b) { return a + b; }, 0) / validos.length
+                : null;
+
+            return {
+                data: [{
+                    type: 'bar',
+                    x: bloque.x,
+                    y: y,
+                    marker: {color: colorPrincipal},
+                    text: y.map(function (v) { return v === null ? null : Math.round(v * 100) / 100; }),
+                    textposition: 'outside',
+                    hovertemplate: '<b>%{x}</b><br>' + nombreMetrica + ': %{y:.2f}<br><extra></extra>'
+                }],
+                layout: {
+                    template: plantilla,
+                    xaxis: {
+                        title: {text: 'Rival (ordenado por fecha)'},
+                        tickangle: 45,
+                        tickfont: {size: 10}
+                    },
+                    yaxis: {
+                        title: {text: nombreMetrica},
+                        range: [0, maxValor === null ? null : maxValor * 1.15]
+                    },
+                    showlegend: false,
+                    margin: {b: 120, t: 30},
+                    plot_bgcolor: 'white',
+                    paper_bgcolor: 'white',
+                    shapes: [{
+                        type: 'line', xref: 'x domain', yref: 'y',
+                        x0: 0, x1: 1, y0: promedio, y1: promedio,
+                        line: {color: 'red', dash: 'dash'}
+                    }],
+                    annotations: [{
+                        text: 'Promedio: ' + (promedio === null ? 'nan' : promedio.toFixed(2)),
+                        showarrow: false,
+                        x: 1, xanchor: 'right', xref: 'x domain',
+                        y: promedio, yanchor: 'bottom', yref: 'y'
+                    }]
+                }
+            };
+        }
+    }
+});
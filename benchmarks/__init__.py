@@ -0,0 +1,4 @@
+"""
+Herramientas de medición del dashboard (datos sintéticos, tamaño de payload)
+Se ejecutan desde la raíz del repositorio, p. ej.: python -m benchmarks.payload
+"""
@@ -0,0 +1,117 @@
+"""
+Datos sintéticos con la forma de las tablas de TruMedia
+
+- Rankings: una fila por equipo con todas las métricas de ESTILO_CONFIG y
+  RENDIMIENTO_CONFIG y sus columnas *_ranking (con empates)
+- Partidos: una fila por equipo y partido (ida y vuelta, N temporadas)
+- Físicas: métricas físicas por equipo y partido
+
+También pueden escribirse en un SQLite local que hace de base de datos (escribir_sqlite).
+
+Los datos son deterministas (semilla fija) para que las mediciones sean comparables.
+"""
+
+import contextlib
+import os
+
+import numpy as np
+import pandas as pd
+
+EQUIPOS = [
+    'RC Deportivo', 'Racing de Santander', 'Real Oviedo', 'Real Zaragoza',
+    'Sporting de Gijón', 'CD Mirandés', 'Levante UD', 'Granada CF',
+    'UD Almería', 'Cádiz CF', 'Elche CF', 'SD Huesca',
+    'Burgos CF', 'CD Castellón', 'Córdoba CF', 'Málaga CF',
+    'SD Eibar', 'Albacete Balompié', 'CD Eldense', 'FC Cartagena',
+    'Racing Club de Ferrol', 'CD Tenerife',
+]
+
+
+def importar_app():
+    """
+    Importa app.py sin base de datos real, sin snapshot local y sin hilo de recarga
+    (las tablas se cargan después con publicar_datos o desde un SQLite local)
+    """
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    os.environ.setdefault('SNAPSHOT_LOCAL', '0')
+    os.environ.setdefault('REFRESCO_DATOS_SEGUNDOS', '0')
+    import app
+    return app
+
+
+def generar_tablas(app, temporadas=1, semilla=0, equipos=EQUIPOS):
+    """Genera (df_rankings, df_partidos, df_fisicas) con las columnas que usa el dashboard"""
+    rng = np.random.default_rng(semilla)
+    metricas = app.columnas_metricas()
+    num_equipos = len(equipos)
+    menor_es_mejor = {
+        m['columna']
+        for config in (app.ESTILO_CONFIG, app.RENDIMIENTO_CONFIG)
+        for m in config['metricas']
+        if m.get('menor_es_mejor', False)
+    }
+    
+    # Rankings: valores redondeados para que haya empates (mismo valor -> misma posición),
+    # con la misma dirección por métrica que el job de rankings
+    rankings = {'fullName': list(equipos), 'teamId': list(range(100, 100 + num_equipos))}
+    for metrica in metricas:
+        valores = np.round(rng.uniform(0, 100, num_equipos), 0 if rng.random() < 0.5 else 2)
+        orden = valores if metrica in menor_es_mejor else -valores
+        rankings[metrica] = valores
+        rankings[f"{metrica}_ranking"] = pd.Series(orden).rank(method='min').astype(int).to_numpy()
+    df_rankings = pd.DataFrame(rankings)
+    
+    # Partidos: todos contra todos a doble vuelta en cada temporada
+    metricas_partido = [m for m in metricas if m not in app.METRICAS_FISICAS]
+    filas_partidos = []
+    filas_fisicas = []
+    game_id = 0
+    fecha = pd.Timestamp('2024-08-16')
+    for jornada in range(2 * (num_equipos - 1) * temporadas):
+        orden = rng.permutation(num_equipos)
+        for k in range(num_equipos // 2):
+            local, visitante = orden[2 * k], orden[2 * k + 1]
+            game_id += 1
+            for equipo, rival in ((local, visitante), (visitante, local)):
+                fila = {
+                    'gameId': game_id,
+                    'gameDate': fecha,
+                    'fullName': equipos[equipo],
+                    'teamId': 100 + equipo,
+                    'oppFullName': equipos[rival],
+                }
+                fila.update(zip(metricas_partido, rng.uniform(0, 10, len(metricas_partido))))
+                filas_partidos.append(fila)
+                
+                fila_fisica = {'gameId': game_id, 'gameDate': fecha, 'teamId': 100 + equipo}
+                fila_fisica.update(zip(app.METRICAS_FISICAS, rng.uniform(1000, 120000, len(app.METRICAS_FISICAS))))
+                filas_fisicas.append(fila_fisica)
+        fecha += pd.Timedelta(days=7)
+    
+    return df_rankings, pd.DataFrame(filas_partidos), pd.DataFrame(filas_fisicas)
+
+
+def publicar_datos(app, temporadas=1, semilla=0):
+    """Genera las tablas sintéticas, las compacta como los cargadores y publica el snapshot"""
+    tablas = [app.compactar_tipos(df) for df in generar_tablas(app, temporadas, semilla)]
+    snapshot = app.construir_snapshot(*tablas)
+    app.publicar_snapshot(snapshot)
+    return snapshot
+
+
+def escribir_sqlite(app, ruta, tablas):
+    """Escribe (df_rankings, df_partidos, df_fisicas) en un SQLite local con los nombres de tabla de la app"""
+    import sqlite3
+    
+    if os.path.exists(ruta):
+        os.remove(ruta)
+    nombres = (app.TABLA_RANKINGS, app.TABLA_PARTIDOS, app.TABLA_FISICAS)
+    with contextlib.closing(sqlite3.connect(ruta)) as conexion:
+        for nombre, df in zip(nombres, tablas):
+            df.to_sql(nombre, conexion, index=False)
+        conexion.commit()
+
+
+def usar_sqlite(app, ruta):
+    """Apunta el engine compartido de la app a un SQLite local"""
+    app._engine = app.crear_engine_compartido(f"sqlite:///{ruta}")
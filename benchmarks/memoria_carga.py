@@ -0,0 +1,103 @@
+"""
+Pico de memoria de la carga de las tablas
+
+Escribe la liga sintética (22 equipos, N temporadas) en un SQLite local y carga las tres
+tablas con cargar_datos_* en un proceso nuevo por configuración, una vez leyendo cada
+tabla entera (CARGA_FILAS_POR_BLOQUE=0) y otra por bloques con cursor de servidor.
+Para cada una se informa del pico de RSS del proceso (resource.getrusage) antes y después
+de cargar, del tiempo de carga y de la memoria de los DataFrames resultantes.
+
+Uso:
+    python -m benchmarks.memoria_carga [--temporadas 100] [--filas-por-bloque 0 10000]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import datos_sinteticos
+
+
+def medir_carga(ruta):
+    """Proceso hijo: carga las tres tablas del SQLite `ruta` y devuelve las medidas"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = datos_sinteticos.importar_app()
+        datos_sinteticos.usar_sqlite(app, ruta)
+    pico_antes = app.pico_rss_mb()
+
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tablas = [app.cargar_datos_rankings(), app.cargar_datos_partidos(), app.cargar_datos_fisicas()]
+    segundos = time.perf_counter() - inicio
+
+    pico = app.pico_rss_mb()
+    return {
+        'filas_por_bloque': app.CARGA_FILAS_POR_BLOQUE,
+        'segundos': round(segundos, 3),
+        'pico_rss_antes_mb': round(pico_antes, 1),
+        'pico_rss_mb': round(pico, 1),
+        'pico_carga_mb': round(pico - pico_antes, 1),
+        'memoria_tablas_mb': round(sum(app.memoria_mb(df) for df in tablas), 1),
+        'filas': [len(df) for df in tablas],
+    }
+
+
+def generar_sqlite(ruta, temporadas, semilla):
+    """Proceso hijo: escribe la liga sintética en el SQLite `ruta`"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = datos_sinteticos.importar_app()
+        datos_sinteticos.escribir_sqlite(app, ruta, datos_sinteticos.generar_tablas(app, temporadas, semilla))
+
+
+def ejecutar(temporadas=100, filas_por_bloque=(0, 10000), semilla=0):
+    # ru_maxrss es el pico de todo el proceso (y un hijo hereda el del padre al hacer fork):
+    # los datos se generan y cada configuración se mide en procesos nuevos, sin cargar nada aquí
+    resultados = []
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'trumedia.db')
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.memoria_carga', '--generar', ruta,
+             '--temporadas', str(temporadas), '--semilla', str(semilla)],
+            check=True,
+        )
+
+        for filas in filas_por_bloque:
+            entorno = dict(os.environ, CARGA_FILAS_POR_BLOQUE=str(filas))
+            salida = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.memoria_carga', '--hijo', ruta],
+                env=entorno, capture_output=True, text=True, check=True,
+            ).stdout
+            resultados.append(json.loads(salida.strip().splitlines()[-1]))
+
+    return {'temporadas': temporadas, 'semilla': semilla, 'resultados': resultados}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--temporadas', type=int, default=100)
+    parser.add_argument('--filas-por-bloque', type=int, nargs='+', default=[0, 10000])
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--hijo', help=argparse.SUPPRESS)
+    parser.add_argument('--generar', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.generar:
+        generar_sqlite(args.generar, args.temporadas, args.semilla)
+        return 0
+
+    if args.hijo:
+        print(json.dumps(medir_carga(args.hijo)))
+        return 0
+
+    print(json.dumps(ejecutar(args.temporadas, args.filas_por_bloque, args.semilla), indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Regresión del tamaño del diagrama serializado
+
+Genera la liga sintética de 22 equipos, serializa la respuesta de actualizar_diagrama
+para cada diagrama y compara con el tamaño fijado. Sale con código 1 si algún diagrama
+se aleja más de la tolerancia en cualquier sentido: si crece (p. ej. al volver a añadir
+estilos en línea a las celdas) o si encoge (hay que fijar el tamaño nuevo en BYTES_FIJADOS).
+Lo mismo se comprueba en tests/test_payload.py.
+
+Uso: python -m benchmarks.payload
+"""
+
+import contextlib
+import io
+import json
+import sys
+
+from benchmarks import datos_sinteticos
+
+# Bytes del JSON del diagrama completo (equipo EQUIPOS[0], semilla 0).
+# Con estilos en línea eran ~93 KB (estilo) y ~115 KB (rendimiento).
+BYTES_FIJADOS = {
+    'estilo': 37712,
+    'rendimiento': 46827,
+}
+TOLERANCIA = 0.05
+
+
+def medir():
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = datos_sinteticos.importar_app()
+        datos_sinteticos.publicar_datos(app)
+    equipo = datos_sinteticos.EQUIPOS[0]
+    return {
+        diagrama: app.bytes_json(app.actualizar_diagrama(diagrama, equipo))
+        for diagrama in BYTES_FIJADOS
+    }
+
+
+def comprobar(diagrama, bytes_medidos):
+    """Error del diagrama si se aleja del tamaño fijado más de la tolerancia (None si está dentro)"""
+    fijado = BYTES_FIJADOS[diagrama]
+    minimo, maximo = int(fijado * (1 - TOLERANCIA)), int(fijado * (1 + TOLERANCIA))
+    if bytes_medidos > maximo:
+        return f"{diagrama}: {bytes_medidos} bytes > {maximo} (fijado {fijado})"
+    if bytes_medidos < minimo:
+        return f"{diagrama}: {bytes_medidos} bytes < {minimo} (fijado {fijado}): actualiza BYTES_FIJADOS"
+    return None
+
+
+def main():
+    medidos = medir()
+    errores = [error for diagrama in BYTES_FIJADOS if (error := comprobar(diagrama, medidos[diagrama]))]
+    
+    print(json.dumps({'bytes': medidos, 'fijados': BYTES_FIJADOS, 'ok': not errores}, indent=2))
+    for error in errores:
+        print(f"✗ {error}", file=sys.stderr)
+    return 1 if errores else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
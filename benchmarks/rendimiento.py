@@ -0,0 +1,201 @@
+"""
+Benchmarks de los caminos críticos del dashboard
+
+Construye una liga sintética (22 equipos, N temporadas), la escribe en un SQLite local
+que hace de base de datos de TruMedia y mide:
+
+- Cargadores: cargar_datos_rankings, cargar_datos_partidos, cargar_datos_fisicas
+- Renderizado: crear_tabla_diagrama, crear_columna_ranking (todas las métricas de un diagrama)
+- Callbacks: actualizar_diagrama y actualizar_grafico_barras, en frío (cachés vacías) y repetidos
+
+Para cada caso se guarda el tiempo de pared (mediana, mínimo y media en ms), las
+asignaciones de memoria (tracemalloc: pico y bytes retenidos) y el tamaño del JSON
+que se enviaría al navegador (o la memoria del DataFrame en los cargadores).
+
+Uso:
+    python -m benchmarks.rendimiento [--temporadas 3] [--repeticiones 20] [--salida resultados.json]
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import datos_sinteticos
+
+VERSION_FORMATO = 1
+
+
+def medir(funcion, repeticiones, preparar=None):
+    """Tiempos de pared y asignaciones de `funcion` (preparar se ejecuta antes de cada llamada, sin medir)"""
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        if preparar:
+            preparar()
+        gc.collect()
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+
+    # Asignaciones en una llamada aparte (tracemalloc ralentiza la medición de tiempos)
+    if preparar:
+        preparar()
+    gc.collect()
+    tracemalloc.start()
+    retenido = funcion()
+    actual, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del retenido
+
+    return resultado, {
+        'repeticiones': repeticiones,
+        'ms_mediana': round(statistics.median(tiempos), 4),
+        'ms_min': round(min(tiempos), 4),
+        'ms_media': round(statistics.fmean(tiempos), 4),
+        'bytes_asignados_pico': pico,
+        'bytes_asignados_retenidos': actual,
+    }
+
+
+def entorno(app):
+    """Versiones y commit con los que se han obtenido los resultados"""
+    import dash
+    import pandas
+    import plotly
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(app.__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pandas.__version__,
+        'dash': dash.__version__,
+        'plotly': plotly.__version__,
+        'plataforma': platform.platform(),
+    }
+
+
+def ejecutar(temporadas=1, repeticiones=20, semilla=0):
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = datos_sinteticos.importar_app()
+
+    resultados = {}
+    silencio = lambda: contextlib.redirect_stdout(io.StringIO())
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'trumedia.db')
+        tablas = datos_sinteticos.generar_tablas(app, temporadas, semilla)
+        datos_sinteticos.escribir_sqlite(app, ruta, tablas)
+        datos_sinteticos.usar_sqlite(app, ruta)
+
+        # Cargadores contra el SQLite local
+        cargados = {}
+        for nombre, cargador in (
+            ('cargar_datos_rankings', app.cargar_datos_rankings),
+            ('cargar_datos_partidos', app.cargar_datos_partidos),
+            ('cargar_datos_fisicas', app.cargar_datos_fisicas),
+        ):
+            with silencio():
+                df, medida = medir(cargador, max(1, repeticiones // 4))
+            if df.empty:
+                raise RuntimeError(f"{nombre} no ha devuelto filas")
+            medida['filas'] = len(df)
+            medida['bytes_memoria'] = int(df.memory_usage(deep=True).sum())
+            resultados[nombre] = medida
+            cargados[nombre] = df
+
+        app._engine.dispose()
+
+    snapshot = app.construir_snapshot(
+        cargados['cargar_datos_rankings'],
+        cargados['cargar_datos_partidos'],
+        cargados['cargar_datos_fisicas'],
+    )
+    app.publicar_snapshot(snapshot)
+
+    equipo = datos_sinteticos.EQUIPOS[0]
+    metricas_grafico = [m['columna'] for m in app.ESTILO_CONFIG['metricas'] if m.get('disponible', True)]
+
+    for diagrama, config in (('estilo', app.ESTILO_CONFIG), ('rendimiento', app.RENDIMIENTO_CONFIG)):
+        tabla, medida = medir(
+            lambda: app.crear_tabla_diagrama(snapshot.indice_rankings, config, equipo), repeticiones)
+        medida['bytes_json'] = app.bytes_json(app.serializar_componente(tabla))
+        resultados[f"crear_tabla_diagrama[{diagrama}]"] = medida
+
+        columnas, medida = medir(lambda: [
+            app.crear_columna_ranking(snapshot.indice_rankings, m['columna'], equipo, m.get('disponible', True))
+            for m in config['metricas']
+        ], repeticiones)
+        medida['columnas'] = len(columnas)
+        medida['bytes_json'] = app.bytes_json(app.serializar_componente(columnas))
+        resultados[f"crear_columna_ranking[{diagrama}]"] = medida
+
+        for estado, preparar in (('frio', app.cache_diagramas.invalidar), ('repetido', None)):
+            salida, medida = medir(lambda: app.actualizar_diagrama(diagrama, equipo), repeticiones, preparar)
+            medida['bytes_json'] = app.bytes_json(salida)
+            resultados[f"actualizar_diagrama[{diagrama},{estado}]"] = medida
+
+    # Gráfico de evolución: recorre las métricas del diagrama para no medir solo una columna
+    for estado, preparar in (('frio', app.cache_graficos.invalidar), ('repetido', None)):
+        llamadas = iter(range(10 ** 9))
+
+        def grafico():
+            metrica = metricas_grafico[next(llamadas) % len(metricas_grafico)] if estado == 'frio' else metricas_grafico[0]
+            return app.actualizar_grafico_barras(equipo, metrica, 'estilo')
+
+        salida, medida = medir(grafico, repeticiones, preparar)
+        medida['bytes_json'] = app.bytes_json(salida)
+        resultados[f"actualizar_grafico_barras[estilo,{estado}]"] = medida
+
+    return {
+        'version_formato': VERSION_FORMATO,
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'entorno': entorno(app),
+        'parametros': {
+            'equipos': len(datos_sinteticos.EQUIPOS),
+            'temporadas': temporadas,
+            'repeticiones': repeticiones,
+            'semilla': semilla,
+            'filas_partidos': len(tablas[1]),
+        },
+        'resultados': resultados,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--temporadas', type=int, default=1)
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', help='Fichero JSON de resultados (por defecto, salida estándar)')
+    args = parser.parse_args(argv)
+
+    informe = ejecutar(args.temporadas, args.repeticiones, args.semilla)
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,27 @@
+"""
+Regresión del tamaño del diagrama serializado (ver benchmarks/payload.py)
+
+Falla si algún diagrama se aleja del tamaño fijado en BYTES_FIJADOS más de la tolerancia,
+tanto si crece como si encoge.
+"""
+
+import pytest
+
+from benchmarks import payload
+
+
+@pytest.fixture(scope='module')
+def medidos():
+    return payload.medir()
+
+
+@pytest.mark.parametrize('diagrama', sorted(payload.BYTES_FIJADOS))
+def test_bytes_fijados(medidos, diagrama):
+    assert payload.comprobar(diagrama, medidos[diagrama]) is None
+
+
+@pytest.mark.parametrize('desvio, fallo', [(0, False), (1, True), (-1, True)])
+def test_comprobar_en_los_dos_sentidos(desvio, fallo):
+    fijado = payload.BYTES_FIJADOS['estilo']
+    bytes_medidos = int(fijado * (1 + desvio * 2 * payload.TOLERANCIA))
+    assert (payload.comprobar('estilo', bytes_medidos) is not None) == fallo